@@ -0,0 +1,239 @@
+"""Check background ingest failures and the frame cache budgets.
+
+Covers the paths a normal upload never takes:
+
+- an ingest that fails part way is replaced by a fresh job on the next upload and lets
+  go of the rows it had cleaned;
+- an export that turns out to be malformed keeps its failed job, so it is not parsed
+  again on every rerun;
+- a header that doesn't match is rejected before any job starts;
+- the memory tier of a FrameCache evicts least recently used frames to stay in its
+  byte and entry budgets, and evicted frames come back from disk;
+- fetching a rollup never reads the cleaned rows back from disk;
+- the disk tier is pruned by age and size.
+
+Runs on synthetic exports (see synthetic.py) with the caches in a temporary directory.
+
+    python benchmarks/ingest_jobs.py [--rows 20k] [--seed 0]
+
+Exits with status 1 and lists the failed checks if there are any.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from synthetic import generate_export, row_count  # noqa: E402
+
+from snapshot import jobs  # noqa: E402
+from snapshot.cache import FrameCache  # noqa: E402
+from snapshot.ingest import (  # noqa: E402
+    ExportSchemaError, cached_rollup, export_key, ingest_cache, load_export, load_rollup, rollup_cache
+)
+
+# Small blocks, so a failing job has cleaned several of them before it fails
+BLOCK_BYTES = 64 * 1024
+
+
+def frame_of(rows):
+    return pd.DataFrame({'a': range(rows)})
+
+
+def check_failed_job_is_replaced(data):
+    failures = []
+    real = jobs.concat_cleaned
+
+    def out_of_memory(blocks):
+        raise MemoryError('simulated')
+
+    jobs.concat_cleaned = out_of_memory
+    try:
+        failed = jobs.start_ingest(data)
+        failed.wait()
+    finally:
+        jobs.concat_cleaned = real
+    if not isinstance(failed.error, MemoryError):
+        failures.append(f'job error is {failed.error!r}, not the MemoryError')
+    if failed.rows_cleaned == 0:
+        failures.append('job failed before cleaning any rows')
+    if failed._blocks or failed._partials:
+        failures.append('failed job still holds its cleaned blocks')
+    if jobs.ingest_job(failed.key) is not failed:
+        failures.append('failed job is not kept for sessions to read its error')
+
+    retry = jobs.start_ingest(data)
+    if retry is failed or retry is None:
+        failures.append('uploading again did not start a fresh job')
+    else:
+        retry.wait()
+        if retry.error is not None:
+            failures.append(f'retry failed: {retry.error!r}')
+        if jobs.ingest_job(retry.key) is not None:
+            failures.append('finished job is still registered')
+        if jobs.start_ingest(data) is not None:
+            failures.append('cached export started another job')
+        expected = load_rollup(data)
+        if not expected.equals(cached_rollup(export_key(data))):
+            failures.append('retried rollup differs from load_rollup')
+    return failures
+
+
+def check_malformed_export_keeps_its_job(data):
+    failures = []
+    # A short row well past the header, so the header check passes and some blocks are cleaned first
+    lines = data.splitlines(keepends=True)
+    bad_at = len(lines) * 3 // 4
+    malformed = b''.join(lines[:bad_at] + [b'2024-01-01\t2023-12\tSpotify\n'] + lines[bad_at:])
+
+    job = jobs.start_ingest(malformed)
+    job.wait()
+    if not isinstance(job.error, ExportSchemaError):
+        failures.append(f'job error is {job.error!r}, not an ExportSchemaError')
+    if job.rows_cleaned == 0:
+        failures.append('job failed before cleaning any rows')
+    if job._blocks or job._partials:
+        failures.append('failed job still holds its cleaned blocks')
+    if jobs.start_ingest(malformed) is not job:
+        failures.append('uploading the malformed export again started a new job')
+    return failures
+
+
+def check_bad_header_is_rejected(data):
+    bad_header = data.replace(b'Sale Month', b'Sale Date', 1)
+    try:
+        jobs.start_ingest(bad_header)
+    except ExportSchemaError:
+        if jobs.ingest_job(export_key(bad_header)) is not None:
+            return ['a job was registered for a rejected header']
+        return []
+    return ['a mismatched header was not rejected']
+
+
+def check_memory_budget(directory):
+    failures = []
+    size = int(frame_of(1000).memory_usage(index=True, deep=True).sum())
+    cache = FrameCache('budget', max_entries=3, max_bytes=int(size * 2.5), directory=directory)
+    for key in 'abc':
+        cache.put(key, frame_of(1000))
+    stats = cache.stats()
+    if stats['entries'] != 2 or stats['bytes'] > cache.max_bytes or stats['evictions'] != 1:
+        failures.append(f'byte budget not kept: {stats}')
+    # 'b' is used again, so 'd' arriving next must push out 'c' instead
+    cache.get('b')
+    cache.put('d', frame_of(1000))
+    if cache.get('b', copy=False) is None or cache.stats()['disk_hits'] != 0:
+        failures.append('the most recently used frame was evicted')
+    if cache.get('a') is None or cache.stats()['disk_hits'] != 1:
+        failures.append('an evicted frame was not read back from disk')
+
+    cache.put('huge', frame_of(100_000))
+    if cache.stats()['entries'] != 1 or cache.get('huge', copy=False) is None:
+        failures.append('a frame over the whole budget was not kept on its own')
+
+    counted = FrameCache('entries', max_entries=2, directory=directory)
+    for key in 'abc':
+        counted.put(key, frame_of(10))
+    if counted.stats()['entries'] != 2:
+        failures.append(f'entry budget not kept: {counted.stats()}')
+    return failures
+
+
+def check_rollup_lookups_skip_rows(rows, seed):
+    """Two datasets under a 1 MiB budget, each looked up three times the way the dashboard pages do."""
+    failures = []
+    exports = [generate_export(rows, seed=seed + 1), generate_export(rows, seed=seed + 2)]
+    keys = []
+    for data in exports:
+        load_export(data, copy=False)
+        load_rollup(data, copy=False)
+        keys.append(export_key(data))
+    budget, ingest_cache.max_bytes = ingest_cache.max_bytes, 1024 ** 2
+    try:
+        before = ingest_cache.stats()
+        for _ in range(3):
+            for key in keys:
+                if cached_rollup(key) is None:
+                    failures.append(f'rollup of {key} is missing')
+        after = ingest_cache.stats()
+    finally:
+        ingest_cache.max_bytes = budget
+    for counter in ['hits', 'disk_hits', 'misses', 'evictions']:
+        if after[counter] != before[counter]:
+            failures.append(
+                f'rollup lookups changed the ingest cache {counter}: {before[counter]} -> {after[counter]}'
+            )
+    return failures
+
+
+def check_disk_pruning(directory):
+    failures = []
+    cache = FrameCache('prune', directory=directory, max_age=3600)
+    cache.put('old', frame_of(10))
+    os.utime(cache.directory / 'old.parquet', (0, 0))
+    cache.put('new', frame_of(10))
+    if (cache.directory / 'old.parquet').exists():
+        failures.append('a file past max_age was not deleted')
+
+    sized = FrameCache('sized', directory=directory)
+    for key in 'abcd':
+        sized.put(key, frame_of(1000))
+        time.sleep(0.01)
+    file_bytes = (sized.directory / 'd.parquet').stat().st_size
+    sized.max_disk_bytes = int(file_bytes * 2.5)
+    sized.put('e', frame_of(1000))
+    left = sorted(path.stem for path in sized.directory.glob('*.parquet'))
+    if left != ['d', 'e']:
+        failures.append(f'size pruning left {left}, not the two most recent files')
+
+    sized.max_disk_bytes = 1
+    sized.put('f', frame_of(1000))
+    left = sorted(path.stem for path in sized.directory.glob('*.parquet'))
+    if left != ['f']:
+        failures.append(f'pruning to a tiny budget left {left}, not just the newest file')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='20k', help='synthetic export size in rows, e.g. 20k or 1M')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rows = row_count(args.rows)
+    data = generate_export(rows, seed=args.seed)
+    directory = Path(tempfile.mkdtemp(prefix='snapshot-checks-'))
+    for cache in [ingest_cache, rollup_cache]:
+        cache.directory = directory / cache.name
+    jobs.INGEST_BLOCK_BYTES = BLOCK_BYTES
+    # The simulated failure is logged with its traceback, which is expected here
+    logging.getLogger('snapshot.jobs').disabled = True
+
+    checks = {
+        'failed job is replaced': lambda: check_failed_job_is_replaced(data),
+        'malformed export keeps its job': lambda: check_malformed_export_keeps_its_job(data),
+        'bad header is rejected': lambda: check_bad_header_is_rejected(data),
+        'memory budget': lambda: check_memory_budget(directory),
+        'rollup lookups skip rows': lambda: check_rollup_lookups_skip_rows(rows, args.seed),
+        'disk pruning': lambda: check_disk_pruning(directory),
+    }
+    failed = 0
+    for name, check in checks.items():
+        try:
+            failures = check()
+        except Exception as exc:  # noqa: BLE001 - reported as a failed check like any other
+            failures = [f'{type(exc).__name__}: {exc}']
+        failed += bool(failures)
+        print(f'{name:>32}: {"; ".join(failures) if failures else "ok"}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""Time and peak memory of each step from raw export to dashboard pages.
+
+Runs on synthetic exports of the given sizes (see synthetic.py) and bypasses the
+ingest, rollup and forecast caches, so every step does its full work. Peak memory is
+what tracemalloc sees: NumPy and pandas allocations, but not Arrow's memory pool.
+
+    python benchmarks/pipeline.py [--sizes 100k 1M] [--repeat 3] [--save FILE] [--compare FILE]
+
+``--save`` writes the results as a JSON baseline; ``--compare`` checks them against an
+earlier baseline and exits with status 1 if any step got slower than ``--tolerance``.
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from synthetic import generate_export, row_count  # noqa: E402
+
+from snapshot import analytics  # noqa: E402
+from snapshot.forecast import fit_forecast, store_histories  # noqa: E402
+from snapshot.ingest import cleaning_process, read_export, rollup, stream_rollup  # noqa: E402
+
+# Slowdowns smaller than this are within run-to-run noise and never count as regressions
+NOISE_SECONDS = 0.05
+
+
+def page_home(months):
+    analytics.window_metrics(months)
+    analytics.window_breakdown(months, 'Country', 'Quantity')
+    for by in ['Title', 'Country', 'Store']:
+        analytics.window_top_n_per_metric(months, by)
+
+
+def page_metric(rollup, months, metric, decimals):
+    analytics.window_shares(months, metric, threshold=1, decimals=decimals)
+    analytics.window_totals(months, 'Year', metric, decimals=decimals)
+    analytics.window_totals(months, 'Month', metric, decimals=decimals)
+    analytics.title_summary(rollup, metric, decimals)
+    releases = analytics.release_index(rollup)
+    title = releases['titles'][0]
+    analytics.release_shares(releases, title, metric, threshold=1, decimals=decimals)
+    analytics.release_totals(releases, title, 'Year', metric, decimals)
+    analytics.release_totals(releases, title, 'Month', metric, decimals)
+
+
+def page_platform_analysis(rollup):
+    analytics.store_aes(rollup)
+    analytics.platform_aes_by_month(rollup)
+
+
+def forecast_all(rollup):
+    for history in store_histories(analytics.platform_aes_by_month(rollup)).values():
+        fit_forecast(history)
+
+
+def measure(step, repeat):
+    """Best wall time of ``repeat`` runs, then the peak traced allocation of one more run."""
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = step()
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    step()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {'seconds': min(timings), 'peak_mib': peak / 1024 ** 2}
+
+
+def run(rows, repeat=3, seed=0):
+    data = generate_export(rows, seed=seed)
+    stages = {}
+    raw, stages['read_export'] = measure(lambda: read_export(data), repeat)
+    cleaned, stages['cleaning_process'] = measure(lambda: cleaning_process(raw.copy()), repeat)
+    rolled, stages['rollup'] = measure(lambda: rollup(cleaned), repeat)
+    _, stages['stream_rollup'] = measure(lambda: stream_rollup(data), repeat)
+    months, stages['month_index'] = measure(lambda: analytics.month_index(rolled), repeat)
+    _, stages['page_home'] = measure(lambda: page_home(months), repeat)
+    _, stages['page_streams'] = measure(lambda: page_metric(rolled, months, 'Quantity', None), repeat)
+    _, stages['page_earnings'] = measure(lambda: page_metric(rolled, months, 'Earnings', 2), repeat)
+    _, stages['page_platform_analysis'] = measure(lambda: page_platform_analysis(rolled), repeat)
+    # Fitting is slow and barely depends on the export size, so it is timed once
+    _, stages['forecast'] = measure(lambda: forecast_all(rolled), 1)
+    return {'rows': rows, 'bytes': len(data), 'rollup_rows': len(rolled), 'stages': stages}
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every step that is more than ``tolerance`` times slower than the baseline."""
+    regressions = []
+    for size, result in results['sizes'].items():
+        for stage, now in result['stages'].items():
+            before = baseline['sizes'].get(size, {}).get('stages', {}).get(stage)
+            if before and now['seconds'] > max(before['seconds'] * tolerance, before['seconds'] + NOISE_SECONDS):
+                regressions.append(
+                    f'{size} {stage}: {now["seconds"]:.3f} s, baseline {before["seconds"]:.3f} s '
+                    f'({now["seconds"] / before["seconds"]:.2f}x)'
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['100k'], help='export sizes in rows, e.g. 100k 1M 10M')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--save', type=Path, help='write the results to this baseline file')
+    parser.add_argument('--compare', type=Path, help='baseline file to check the results against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'sizes': {size: run(row_count(size), args.repeat, args.seed) for size in args.sizes},
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for size, result in results['sizes'].items():
+            print(f'{size} rows ({result["bytes"] / 1024 ** 2:.0f} MiB, {result["rollup_rows"]:,} rollup rows)')
+            for stage, timing in result['stages'].items():
+                print(f'  {stage:>22}: {timing["seconds"]:8.3f} s {timing["peak_mib"]:9.1f} MiB peak')
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps(results, indent=2) + '\n')
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        for line in regressions:
+            print(f'slower than baseline: {line}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Cold-start import cost of the dashboard script.
+
+Compares the imports the script used to run at the top (including Prophet, Plotly
+Express and pycountry) with the ones it runs now, read from the script itself, each in
+a fresh interpreter so nothing is already cached in sys.modules.
+
+    python benchmarks/startup.py [--runs 5] [--json]
+"""
+import argparse
+import ast
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+
+def script_imports(script=REPO_ROOT / 'snapshot-sl.py'):
+    """The import statements at the top level of the dashboard script, as source lines."""
+    tree = ast.parse(script.read_text(encoding='utf-8'))
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+IMPORT_SETS = {
+    # Module-level imports of snapshot-sl.py before heavy dependencies were loaded lazily
+    'eager': [
+        f'import {module}' for module in ['pandas', 'numpy', 'streamlit', 'pycountry', 'plotly.express', 'prophet']
+    ],
+    # Module-level imports of snapshot-sl.py now, i.e. what the Upload page costs
+    'lazy': script_imports(),
+}
+
+
+def time_imports(statements):
+    code = (
+        'import time\n'
+        'start = time.perf_counter()\n'
+        + ''.join(f'{statement}\n' for statement in statements)
+        + 'print(time.perf_counter() - start)\n'
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = {}
+    for name, statements in IMPORT_SETS.items():
+        timings = [time_imports(statements) for _ in range(args.runs)]
+        results[name] = {'median_seconds': statistics.median(timings), 'runs': timings}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            print(f'{name:>6}: {result["median_seconds"]:.3f} s (median of {args.runs})')
+        print(f'speedup: {results["eager"]["median_seconds"] / results["lazy"]["median_seconds"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Seeded synthetic DistroKid exports for benchmarking.
+
+Rows follow the export's column layout and rough shape: a few stores, titles and
+countries account for most rows, most lines report a handful of streams, and a small
+share of Reporting Dates are DistroKid's '#' placeholder.
+
+    python benchmarks/synthetic.py OUT.tsv [--rows 1M] [--titles 60] [--stores 20] [--countries 60] [--seed 0]
+"""
+import argparse
+import contextlib
+import io
+import os
+import string
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    'Reporting Date', 'Sale Month', 'Store', 'Artist', 'Title', 'ISRC', 'UPC', 'Quantity', 'Team Percentage',
+    'Song/Album', 'Country of Sale', 'Songwriter Royalties Withheld', 'Earnings (USD)',
+]
+
+# Most common stores in the sample export first, with a typical per-stream payout
+STORES = {
+    'Spotify': 0.003, 'Facebook': 0.0001, 'Apple Music': 0.006, 'YouTube (Ads)': 0.002, 'TikTok': 0.0005,
+    'YouTube (Red)': 0.008, 'Resso': 0.001, 'Amazon Unlimited (Streaming)': 0.007, 'NetEase': 0.0008,
+    'LyricFind': 0.0002, 'Pandora': 0.0015, 'Boomplay': 0.0006, 'Amazon Prime (Streaming)': 0.004,
+    'Deezer': 0.0035, 'Tidal': 0.009, 'kkbox': 0.004, 'Yandex': 0.001, 'TikTok Music (Audio)': 0.0005,
+    'Snap': 0.0003, 'Medianet': 0.004, 'Napster': 0.0045, 'Anghami': 0.0008, 'iTunes': 0.7,
+    'Saavn': 0.0004, 'Audiomack': 0.0005,
+}
+
+# Alpha-2 codes roughly ordered by how much they stream; 'OU' is DistroKid's unattributed code
+COUNTRIES = [
+    'US', 'SG', 'ID', 'GB', 'IN', 'DE', 'SE', 'PH', 'MY', 'CA', 'AU', 'BR', 'MX', 'FR', 'NL', 'JP', 'KR', 'TH',
+    'VN', 'TR', 'IT', 'ES', 'PL', 'NO', 'DK', 'FI', 'IE', 'NZ', 'ZA', 'NG', 'KE', 'EG', 'SA', 'AE', 'IL', 'AR',
+    'CL', 'CO', 'PE', 'VE', 'EC', 'BE', 'CH', 'AT', 'PT', 'GR', 'CZ', 'HU', 'RO', 'BG', 'UA', 'RU', 'KZ', 'PK',
+    'BD', 'LK', 'TW', 'HK', 'CN', 'OU',
+]
+
+MISSING_DATE_SHARE = 0.001
+
+
+def zipf_weights(n, exponent=1.1):
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def catalogue(titles, rng):
+    """Title, ISRC and UPC of each release, plus its first sale month."""
+    letters = np.array(list(string.ascii_uppercase))
+    names = [f'Track {i + 1:03d}' for i in range(titles)]
+    isrcs = [f'QZ{"".join(rng.choice(letters, 3))}{rng.integers(10 ** 7):07d}' for _ in range(titles)]
+    upcs = rng.integers(10 ** 11, 10 ** 12, size=titles).astype(str)
+    months = pd.period_range('2019-01', '2024-11', freq='M')
+    released = rng.integers(0, len(months) - 1, size=titles)
+    return pd.DataFrame({'Title': names, 'ISRC': isrcs, 'UPC': upcs, 'first_month': released}), months
+
+
+def generate_chunk(rows, releases, months, stores, countries, artist, rng):
+    """``rows`` random export lines as a DataFrame with the export's columns."""
+    release = rng.choice(len(releases), size=rows, p=zipf_weights(len(releases)))
+    first = releases['first_month'].to_numpy()[release]
+    sale_month = first + (rng.random(rows) * (len(months) - first)).astype(int)
+    store = rng.choice(len(stores), size=rows, p=zipf_weights(len(stores)))
+    country = rng.choice(len(countries), size=rows, p=zipf_weights(len(countries)))
+    quantity = rng.zipf(1.8, size=rows).clip(max=50_000)
+    payout = np.array(list(stores.values()))[store]
+    earnings = quantity * payout * rng.lognormal(0, 0.3, size=rows)
+
+    # Sales are reported one to three months after the month they happened in
+    sale_start = months[sale_month].to_timestamp().to_numpy()
+    delay = rng.integers(30, 90, size=rows).astype('timedelta64[D]')
+    reporting = pd.Series(sale_start + delay).dt.strftime('%Y-%m-%d').to_numpy()
+    reporting[rng.random(rows) < MISSING_DATE_SHARE] = '#'
+
+    return pd.DataFrame({
+        'Reporting Date': reporting,
+        'Sale Month': months[sale_month].strftime('%Y-%m'),
+        'Store': np.array(list(stores))[store],
+        'Artist': artist,
+        'Title': releases['Title'].to_numpy()[release],
+        'ISRC': releases['ISRC'].to_numpy()[release],
+        'UPC': releases['UPC'].to_numpy()[release],
+        'Quantity': quantity,
+        'Team Percentage': 100,
+        'Song/Album': 'Song',
+        'Country of Sale': np.array(countries)[country],
+        'Songwriter Royalties Withheld': 0,
+        'Earnings (USD)': earnings.round(8),
+    }, columns=COLUMNS)
+
+
+def export_chunks(rows, titles=60, stores=20, countries=60, artist='Synthetic Artist', seed=0,
+                  chunk_rows=500_000):
+    """Yield a synthetic export of ``rows`` lines as DataFrames of at most ``chunk_rows``.
+
+    The same arguments always produce the same rows.
+    """
+    rng = np.random.default_rng(seed)
+    releases, months = catalogue(titles, rng)
+    stores = dict(list(STORES.items())[:stores])
+    countries = COUNTRIES[:countries]
+    for start in range(0, rows, chunk_rows):
+        yield generate_chunk(min(chunk_rows, rows - start), releases, months, stores, countries, artist, rng)
+
+
+def write_export(out, rows, **kwargs):
+    """Write a synthetic export to ``out``, a path or text file, one chunk at a time."""
+    with contextlib.ExitStack() as stack:
+        f = stack.enter_context(open(out, 'w', newline='')) if isinstance(out, (str, os.PathLike)) else out
+        for i, chunk in enumerate(export_chunks(rows, **kwargs)):
+            chunk.to_csv(f, sep='\t', index=False, header=i == 0)
+
+
+def generate_export(rows, **kwargs):
+    """A synthetic export as bytes, the way an upload arrives."""
+    buffer = io.StringIO()
+    write_export(buffer, rows, **kwargs)
+    return buffer.getvalue().encode()
+
+
+def row_count(text):
+    """Parse sizes such as 100k, 1M or 10M."""
+    text = text.strip().lower()
+    scale = {'k': 10 ** 3, 'm': 10 ** 6}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out')
+    parser.add_argument('--rows', type=row_count, default=row_count('100k'), help='e.g. 100k, 1M, 10M')
+    parser.add_argument('--titles', type=int, default=60)
+    parser.add_argument('--stores', type=int, default=20, help=f'at most {len(STORES)}')
+    parser.add_argument('--countries', type=int, default=60, help=f'at most {len(COUNTRIES)}')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_export(args.out, args.rows, titles=args.titles, stores=args.stores, countries=args.countries, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Check the month index window functions against filtering the rollup directly.
+
+The window_* functions answer a sale month range from running totals, which is easy
+to get wrong by one month. This compares each of them, on a synthetic export (see
+synthetic.py) with some sales left without a sale month, with the same numbers worked
+out by filtering the rollup to the range and grouping it: for the full range, ranges
+open at either end, partial and single-month ranges, an inverted range and ranges
+outside the data. The same ranges are then checked on the empty rollup of a
+header-only export, read whole and streamed.
+
+    python benchmarks/windows.py [--rows 20k] [--seed 0]
+
+Exits with status 1 and lists the mismatches if there are any.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from synthetic import COLUMNS, generate_export, row_count  # noqa: E402
+
+from snapshot import analytics  # noqa: E402
+from snapshot.ingest import cleaning_process, read_export, rollup, stream_rollup  # noqa: E402
+
+METRICS = ['Quantity', 'Earnings']
+
+
+def synthetic_rollup(rows, seed):
+    """Rollup of a synthetic export in which one row in fifty has no sale month."""
+    cleaned = cleaning_process(read_export(generate_export(rows, seed=seed)))
+    rolled = rollup(cleaned)
+    undated = np.random.default_rng(seed).random(len(rolled)) < 0.02
+    rolled['Month'] = rolled['Month'].mask(undated)
+    return rolled
+
+
+def empty_rollups():
+    """Rollups of a header-only export as load_rollup and stream_rollup build them."""
+    header = '\t'.join(COLUMNS).encode() + b'\n'
+    return {
+        'empty': rollup(cleaning_process(read_export(header))),
+        'empty, streamed': stream_rollup(header),
+    }
+
+
+def ranges(months):
+    """(label, start, stop) of every kind of range the sale month selector can produce, and a few it can't."""
+    first, last = months[0], months[-1]
+    middle = months[len(months) // 2]
+    return [
+        ('full', None, None),
+        ('open start', None, middle),
+        ('open end', middle, None),
+        ('first to last', first, last),
+        ('partial', months[3], months[-4]),
+        ('single month', middle, middle),
+        ('first month', first, first),
+        ('last month', last, last),
+        ('inverted', months[-4], months[3]),
+        ('before the data', first - 24, first - 12),
+        ('after the data', last + 12, last + 24),
+        ('overlapping the start', first - 6, months[2]),
+    ]
+
+
+def in_range(rolled, start, stop):
+    """The rollup rows between ``start`` and ``stop``; undated rows only count for the full range."""
+    if start is None and stop is None:
+        return rolled
+    keep = rolled['Month'].notna()
+    if start is not None:
+        keep &= rolled['Month'] >= start
+    if stop is not None:
+        keep &= rolled['Month'] <= stop
+    return rolled[keep]
+
+
+def same(actual, expected):
+    """Whether two Series or frames hold the same labels and (to rounding) the same values."""
+    if isinstance(actual, pd.Series):
+        actual, expected = actual.sort_index(), expected.sort_index()
+        return list(actual.index) == list(expected.index) and np.allclose(actual.to_numpy(), expected.to_numpy())
+    if list(actual.columns) != list(expected.columns) or len(actual) != len(expected):
+        return False
+    return all(
+        np.allclose(actual[col].to_numpy(), expected[col].to_numpy()) if pd.api.types.is_numeric_dtype(expected[col])
+        else list(actual[col]) == list(expected[col])
+        for col in expected.columns
+    )
+
+
+def check_range(rolled, months, start, stop):
+    """Names of the window functions that disagree with the filtered rollup for one range."""
+    subset = in_range(rolled, start, stop)
+    failures = []
+
+    metrics, expected = analytics.window_metrics(months, start, stop), analytics.key_metrics(subset)
+    if metrics['total_streams'] != expected['total_streams'] or not np.isclose(
+        metrics['total_earnings'], expected['total_earnings']
+    ) or not np.isclose(metrics['avg_eps'], expected['avg_eps'], equal_nan=True):
+        failures.append('window_metrics')
+
+    for by in analytics.WINDOW_BREAKDOWNS:
+        for metric in METRICS:
+            expected = subset.groupby(by, observed=True)[metric].sum()
+            if not same(analytics.window_breakdown(months, by, metric, start, stop), expected):
+                failures.append(f'window_breakdown {by} {metric}')
+
+    for by in ['Title', 'Country', 'Store']:
+        tops = analytics.window_top_n_per_metric(months, by, start=start, stop=stop)
+        expected = analytics.top_n_per_metric(subset, by)
+        for metric in METRICS:
+            # Compared in rank order: the lists are shown as ranked
+            if list(tops[metric].index) != list(expected[metric].index) or not np.allclose(tops[metric], expected[metric]):
+                failures.append(f'window_top_n_per_metric {by} {metric}')
+
+    for metric, decimals in [('Quantity', None), ('Earnings', 2)]:
+        store_totals = subset.groupby('Store', observed=True)[metric].sum()
+        if not same(analytics.window_shares(months, metric, 1, start, stop, decimals),
+                    analytics.share_table(store_totals, metric, 1, decimals)):
+            failures.append(f'window_shares {metric}')
+        if not same(analytics.window_totals(months, 'Month', metric, start, stop, decimals),
+                    analytics.monthly_totals(subset, metric, decimals)):
+            failures.append(f'window_totals Month {metric}')
+        yearly = subset.groupby('Year')[metric].sum().reset_index()
+        if decimals is not None:
+            yearly[metric] = yearly[metric].round(decimals)
+        if not same(analytics.window_totals(months, 'Year', metric, start, stop, decimals), yearly):
+            failures.append(f'window_totals Year {metric}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='20k', help='synthetic export size in rows, e.g. 20k or 1M')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rolled = synthetic_rollup(row_count(args.rows), args.seed)
+    months = analytics.month_index(rolled)
+    mismatches = 0
+    for name, frame in {'synthetic': rolled, **empty_rollups()}.items():
+        print(f'{name} rollup ({len(frame):,} rows)')
+        index = analytics.month_index(frame)
+        # The empty rollups have no months of their own, so they get the synthetic ranges
+        for label, start, stop in ranges(months['months']):
+            try:
+                failures = check_range(frame, index, start, stop)
+            except Exception as exc:  # noqa: BLE001 - reported as a mismatch like any other
+                failures = [f'{type(exc).__name__}: {exc}']
+            mismatches += len(failures)
+            print(f'{label:>24} ({start} to {stop}): {", ".join(failures) if failures else "ok"}')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,71 +1,156 @@
-import pandas as pd
-import numpy as np
-import streamlit as st
-import pycountry
-import plotly.express as px
-from prophet import Prophet
-
-st.set_page_config(page_title='Snapshot', page_icon='📸', layout='wide')
-
-def cleaning_process(artist_data):
-    # Drop unnecessary columns
-    columns_to_drop = ['ISRC', 'UPC', 'Team Percentage', 'Song/Album', 'Songwriter Royalties Withheld']
-    artist_data = artist_data.drop(columns=[col for col in columns_to_drop if col in artist_data.columns], errors='ignore')
-
-    # Renaming 'Earnings (USD)' to 'Earnings'
-    if 'Earnings (USD)' in artist_data.columns:
-        artist_data['Earnings'] = artist_data['Earnings (USD)']
-        artist_data = artist_data.drop(columns=['Earnings (USD)'])
-
-    # Convert 2-letter country codes to full country names
-    def get_country_name(alpha_2_code):
-        if pd.isna(alpha_2_code) or alpha_2_code == 'OU':
-            return 'Unknown'
-        try:
-            country = pycountry.countries.get(alpha_2=alpha_2_code.upper())
-            return country.name if country else 'Unknown'
-        except AttributeError:
-            return 'Unknown'
-
-    if 'Country of Sale' in artist_data.columns:
-        artist_data['Country'] = artist_data['Country of Sale'].apply(get_country_name)
-        artist_data = artist_data.drop(columns=['Country of Sale'])
+import time
 
-    if 'Reporting Date' in artist_data.columns:
-            artist_data['Reporting Date'] = artist_data['Reporting Date'].astype(str)
-
-            # Replace invalid entries (e.g., '#') with NaN
-            artist_data['Reporting Date'] = artist_data['Reporting Date'].replace(r'^[#]+$', pd.NA, regex=True)
-
-            # Convert valid Reporting Date to datetime
-            artist_data['Reporting Date'] = pd.to_datetime(artist_data['Reporting Date'], errors='coerce', format='%Y-%m-%d')
+import streamlit as st
 
-            # For rows with missing Reporting Date, infer from Sale Month
-            if 'Sale Month' in artist_data.columns:
-                missing_reporting_date = artist_data['Reporting Date'].isna()
-                artist_data.loc[missing_reporting_date, 'Reporting Date'] = pd.to_datetime(
-                    artist_data.loc[missing_reporting_date, 'Sale Month'] + '-01', errors='coerce'
-                )
+from snapshot import trace
+from snapshot.analytics import (
+    month_index, platform_aes_by_month, release_index, release_shares, release_totals, store_aes, title_summary,
+    window_breakdown, window_metrics, window_shares, window_top_n_per_metric, window_totals
+)
+from snapshot.export import EXPORT_FORMATS, export_bytes
+from snapshot.forecast import DEFAULT_FORECASTER, FORECASTER_LABELS, forecast_platforms, store_histories
+from snapshot.ingest import (
+    ExportSchemaError, cached_rollup, cached_rows, export_key, ingest_cache, load_export, load_rollup, memory_report, rollup_cache
+)
+from snapshot.jobs import ingest_job, start_ingest
+from snapshot.library import add_export, has_library, library_dir, library_key, load_library, new_library_id
+from snapshot.render import grouped_list_html, list_html
 
-            # Optional: Drop rows with invalid dates after all attempts to clean
-            artist_data = artist_data.dropna(subset=['Reporting Date'])    
+st.set_page_config(page_title='Snapshot', page_icon='📸', layout='wide')
 
-    return artist_data
+# Opt-in timing panel, turned on with SNAPSHOT_TRACE=1 or by adding ?trace=1 to the URL
+tracing = trace.ENABLED or st.query_params.get('trace') == '1'
+if tracing:
+    trace_records = trace.start_recording()
+    rerun_started = time.perf_counter()
 
 if 'uploaded_file' not in st.session_state:
     st.session_state['uploaded_file'] = None
-if 'cad' not in st.session_state:
-    st.session_state['cad'] = None
+if 'dataset' not in st.session_state:
+    st.session_state['dataset'] = None
 if 'current_page' not in st.session_state:
     st.session_state.current_page = 'Upload'
 
 def load_sample_data():
     file_path = 'sample_data/DistroKid_1734544230367.tsv'
-    raw_data = pd.read_csv(file_path, sep = "\t")
+    with open(file_path, 'rb') as f:
+        data = f.read()
     st.session_state['uploaded_file'] = file_path
-    st.session_state['cad'] = cleaning_process(raw_data)
+    load_export(data, copy=False)
+    load_rollup(data, copy=False)
+    st.session_state['dataset'] = export_key(data)
     st.success('Sample data loaded!')
 
+@st.cache_resource
+def map_countries():
+    """Every country name the choropleth can place, from Plotly's bundled gapminder data."""
+    import plotly.express as px
+
+    return px.data.gapminder()[['country']].drop_duplicates().rename(columns={'country': 'Country'})
+
+@st.cache_resource(max_entries=32)
+def country_map(dataset, include_us, start, stop, _months):
+    """Streams per country as a world map, built once per dataset, US toggle and date range."""
+    import plotly.express as px
+
+    country_streams = window_breakdown(_months, 'Country', 'Quantity', start, stop).reset_index()
+    country_streams_all = map_countries().merge(country_streams, on='Country', how='outer')
+    country_streams_all['Quantity'] = country_streams_all['Quantity'].fillna(0)
+    country_streams_exu = country_streams_all[country_streams_all['Country'] != 'Unknown']
+    if not include_us:
+        country_streams_exu = country_streams_exu[country_streams_exu['Country'] != 'United States']
+
+    mint_green_scale = [
+        (0.0, '#e3faf0'),
+        (0.3, '#baf7dd'),
+        (0.6, '#84f5c5'),
+        (1.0, '#37faa9')
+    ]
+
+    fig = px.choropleth(
+        country_streams_exu, locations='Country', locationmode='country names',
+        color='Quantity',
+        color_continuous_scale=mint_green_scale
+    )
+
+    fig.update_layout(
+        geo=dict(
+            bgcolor='black',
+            landcolor='white'
+        ), title=None, margin=dict(l=0, r=0, t=0, b=0), height=400
+    )
+    return fig
+
+@st.cache_resource(max_entries=4)
+def converted_export(dataset, fmt, _cad):
+    """A dataset's cleaned rows as a download, converted once per dataset and format."""
+    return export_bytes(_cad, fmt)
+
+@st.cache_data(max_entries=8)
+def dataset_memory_report(dataset, _cad):
+    """memory_report of a dataset's cleaned rows, worked out once rather than on every Upload page rerun."""
+    return memory_report(_cad)
+
+@st.cache_resource(max_entries=8)
+def month_lookup(dataset, _rollup):
+    """The month index of a dataset, built once so any date range is answered without rescanning the rollup."""
+    return month_index(_rollup)
+
+@st.cache_resource(max_entries=8)
+def release_lookup(dataset, _rollup):
+    """The release index of a dataset, built once so picking a release only slices it."""
+    return release_index(_rollup)
+
+def session_library(create=False):
+    """This user's library directory, or None if they have none yet and ``create`` is False.
+
+    The library id is kept in the URL (?library=...), so it survives reloads and the
+    page can be bookmarked, while other users never see it.
+    """
+    try:
+        return library_dir(st.query_params.get('library'))
+    except ValueError:
+        if not create:
+            return None
+    st.query_params['library'] = new_library_id()
+    return library_dir(st.query_params['library'])
+
+def load_library_data(directory):
+    st.session_state['uploaded_file'] = str(directory)
+    load_library(directory, copy=False)
+    st.session_state['dataset'] = library_key(directory)
+
+def session_rows():
+    """Cleaned rows of this session's dataset, which only the Upload page needs.
+
+    Sessions only keep the dataset key. The frames live in process-wide caches and are
+    shared with every session that loaded the same data, so they must not be modified.
+    """
+    if st.session_state['dataset'] is None:
+        return None
+    return cached_rows(st.session_state['dataset'])
+
+def session_rollup():
+    """Rollup of this session's dataset, shared like session_rows."""
+    if st.session_state['dataset'] is None:
+        return None
+    return cached_rollup(st.session_state['dataset'])
+
+@st.fragment(run_every=1)
+def ingest_progress(dataset):
+    """Progress of a background ingest, refreshed every second without rerunning the page."""
+    job = ingest_job(dataset)
+    if job is None or job.done:
+        # Finished since the page was drawn: rerun it to show the full results
+        st.rerun()
+    st.progress(
+        job.progress,
+        text=f'Loading: {job.bytes_parsed / 1024 ** 2:,.0f} of {job.total_bytes / 1024 ** 2:,.0f} MiB parsed, '
+             f'{job.rows_cleaned:,} rows cleaned'
+    )
+    if job.rows_cleaned and st.button('Show results so far'):
+        st.rerun()
+
 with st.sidebar:
     st.title("🎯 Dashboard")
     home_button = st.button("🏠 Home")
@@ -99,36 +184,114 @@ if st.session_state.current_page == 'Upload':
 
     uploaded_file = st.file_uploader("Upload your file here", type=['tsv'])
 
+    merge_into_library = st.checkbox('Add uploads to my library (merges overlapping exports)')
+
     if st.button("Load Sample Data"):
         load_sample_data()
 
+    library = session_library()
+    if library is not None and has_library(library) and st.button("Load Library"):
+        load_library_data(library)
+        st.success('Library loaded!')
+
     if uploaded_file is not None:
-        st.session_state['uploaded_file'] = uploaded_file
-        raw_data = pd.read_csv(uploaded_file, sep='\t')
-        st.session_state['cad'] = cleaning_process(raw_data)
+        data = uploaded_file.getvalue()
+        try:
+            if merge_into_library:
+                # Only merge each distinct upload once, not on every rerun
+                library = session_library(create=True)
+                if st.session_state.get('merged_export') != export_key(data):
+                    merged = add_export(data, library)
+                    st.session_state['merged_export'] = export_key(data)
+                    st.info(f"Added {merged['new_rows']:,} new rows across {len(merged['partitions'])} months to your library. "
+                            "Bookmark this page to come back to it.")
+                load_library_data(library)
+            else:
+                # Parsing and cleaning run in the background; pages show what is done so far
+                job = start_ingest(data)
+                st.session_state['dataset'] = export_key(data)
+                st.session_state['uploaded_file'] = uploaded_file
+                if job is not None and job.error is not None:
+                    st.error(str(job.error))
+                    st.stop()
+        except ExportSchemaError as exc:
+            st.error(str(exc))
+            st.stop()
         st.success("File uploaded successfully! You can now navigate to other pages.")
 
-        csv = st.session_state['cad'].to_csv(index=False)  # Convert DataFrame to CSV
-        st.download_button(
-            label="Converted Data (CSV)",
-            data=csv,
-            file_name="Artist_Data.csv",
-            mime="text/csv"
-        )
+        cad = session_rows()
+        if cad is not None:
+            export_format = st.radio(
+                'Converted data format', list(EXPORT_FORMATS), format_func=lambda fmt: EXPORT_FORMATS[fmt][0],
+                horizontal=True
+            )
+            # Converting can take a while on big exports, so it only happens when asked for
+            export_request = (st.session_state['dataset'], export_format)
+            if st.button('Prepare converted data'):
+                st.session_state['export_request'] = export_request
+            if st.session_state.get('export_request') == export_request:
+                label, file_name, mime = EXPORT_FORMATS[export_format]
+                st.download_button(
+                    label=f"Converted Data ({label})",
+                    data=converted_export(*export_request, cad),
+                    file_name=file_name,
+                    mime=mime
+                )
+
+    cad = session_rows()
+    if cad is not None:
+        with st.expander('Memory usage'):
+            st.dataframe(dataset_memory_report(st.session_state['dataset'], cad), use_container_width=True)
 
 else:
-    if st.session_state['cad'] is None:
-        st.title('Please upload data to begin.')
+    dataset = st.session_state['dataset']
+    # Looked up before the caches: a job only goes away once its results are cached
+    job = ingest_job(dataset) if dataset is not None else None
+    rollup = session_rollup()
+    rows_so_far = None
+    if rollup is None and job is not None and job.error is None:
+        rows_so_far, rollup = job.partial_rollup()
+        # Views cached per dataset are kept apart for each stage of the upload
+        dataset = f'{dataset}:{rows_so_far}'
+    if rollup is None:
+        if job is not None and job.error is not None:
+            st.error(str(job.error))
+        elif job is not None:
+            st.title('Loading your data...')
+        else:
+            st.title('Please upload data to begin.')
     else:
-        cad = st.session_state['cad']
+        if rows_so_far is not None:
+            st.info(f'Still loading your data: these pages cover the first {rows_so_far:,} rows so far.')
+
+        # Every page reads the per (Month, Year, Store, Title, Country) rollup, not the raw rows.
+        # It is shared between sessions, so pages must not add or overwrite columns on it.
+        # Plotly is only needed once there is something to chart, so the Upload page doesn't pay for it
+        import plotly.express as px
+
+        # Key metrics, top 5 lists and the Streams/Earnings charts cover the sale months picked here
+        months = month_lookup(dataset, rollup)
+        start = stop = None
+        if len(months['months']) > 1:
+            with st.sidebar:
+                month_range = st.select_slider(
+                    'Sale months', options=list(months['months']),
+                    value=(months['months'][0], months['months'][-1]), format_func=str,
+                    help='Applies to the key metrics, the top 5 lists and the Streams and Earnings charts.'
+                )
+            # The full range also counts sales without a sale month
+            if month_range != (months['months'][0], months['months'][-1]):
+                start, stop = month_range
+
         if st.session_state.current_page == 'Home':
             st.title('At a glance...')
             c1, c2, c3 = st.columns(3)
 
             # Key metrics for home page
-            total_streams = cad['Quantity'].sum()
-            total_earnings = cad['Earnings'].sum()
-            avg_eps = total_earnings / total_streams
+            metrics = window_metrics(months, start, stop)
+            total_streams = metrics['total_streams']
+            total_earnings = metrics['total_earnings']
+            avg_eps = metrics['avg_eps']
 
             def key_metric_styling(label, value):
                 return f"""
@@ -151,79 +314,33 @@ else:
                 st.markdown(key_metric_styling('Average Earnings/Stream', f"${round(avg_eps, 5):,} (AES)"), unsafe_allow_html=True)
 
             st.subheader('International Reach')
-            # Getting all countries for the graph
-            all_countries = px.data.gapminder()[['country']].drop_duplicates()
-            all_countries.columns = ['Country']
-
-            country_streams = cad.groupby('Country')['Quantity'].sum().reset_index()
-            country_streams_all = all_countries.merge(country_streams, on='Country', how='outer')
-            country_streams_all['Quantity'] = country_streams_all['Quantity'].fillna(0)
-            country_streams_exu = country_streams_all[country_streams_all['Country'] != 'Unknown']
-
             include_us = st.checkbox('Include US Data', value=False)
-            if not include_us:
-                country_streams_exu = country_streams_exu[country_streams_exu['Country'] != 'United States']
-
-            mint_green_scale = [
-                (0.0, '#e3faf0'),
-                (0.3, '#baf7dd'),
-                (0.6, '#84f5c5'),
-                (1.0, '#37faa9')
-            ]
-
-            fig = px.choropleth(
-                country_streams_exu, locations='Country', locationmode='country names',
-                color='Quantity',
-                color_continuous_scale=mint_green_scale
-            )
-
-            fig.update_layout(
-                geo=dict(
-                    bgcolor='black',
-                    landcolor='white'
-                ), title=None, margin=dict(l=0, r=0, t=0, b=0), height=400
-            )
-
+            with trace.span('choropleth'):
+                fig = country_map(dataset, include_us, start, stop, months)
             st.plotly_chart(fig, use_container_width=True)
             
-            # Top 5 Section
+            # Top 5 Section, one pass per dimension for both streams and earnings
+            top5 = {by: window_top_n_per_metric(months, by, start=start, stop=stop) for by in ['Title', 'Country', 'Store']}
             c1a, c2a, c3a = st.columns([2, 0.3, 2])
             
-            # Styling for Top 5 section
-            def top_5_styling(label, value):
-                return f"""
-                <div style="display: flex; align-items: center; margin-bottom: 10px;">
-                    <div style="font-size: 20px; font-weight: bold; color: white; text-align: left; width: fit-content;">
-                        {label}
-                    </div>
-                    <div style="flex-grow: 1; height: 2px; background-image: linear-gradient(to right, white, #37faa9); margin: 0 10px;"></div>
-                    <div style="font-size: 16px; font-weight: bold; color: #37faa9; text-align: right; width: fit-content;">
-                        {value}
-                    </div>
-                </div>
-                """
-            
             # Top 5 - Streams
             with c1a:
                 st.header('Top 5 Releases')
                 st.subheader('Streams')
-                top5releases_s = cad.groupby('Title')['Quantity'].sum().sort_values(ascending = False).head()
-                for title, quantity in top5releases_s.items():
-                    st.markdown(top_5_styling(title, quantity), unsafe_allow_html=True)
+                top5releases_s = top5['Title']['Quantity']
+                st.html(list_html(top5releases_s.index, top5releases_s))
                 st.write('') # Empty for spacing
 
                 st.header('Top 5 Countries')
                 st.subheader('Streams')
-                top5countries_s = cad[cad['Country'] != 'Unknown'].groupby('Country')['Quantity'].sum().sort_values(ascending = False).head()
-                for country, title in top5countries_s.items():
-                    st.markdown(top_5_styling(country, title), unsafe_allow_html=True)
+                top5countries_s = top5['Country']['Quantity']
+                st.html(list_html(top5countries_s.index, top5countries_s))
                 st.write('') # Empty for spacing
             
                 st.header('Top 5 Platforms')
                 st.subheader('Streams')
-                top5platforms_s = cad.groupby('Store')['Quantity'].sum().sort_values(ascending = False).head()
-                for store, quantity in top5platforms_s.items():
-                    st.markdown(top_5_styling(store, quantity), unsafe_allow_html=True)
+                top5platforms_s = top5['Store']['Quantity']
+                st.html(list_html(top5platforms_s.index, top5platforms_s))
 
             # Spacing column
             with c2a:
@@ -234,23 +351,20 @@ else:
             # Top 5 Earnings section
                 st.header('') # Empty for spacing
                 st.subheader('Earnings (USD)')
-                top5releases_e = cad.groupby('Title')['Earnings'].sum().sort_values(ascending = False).head()
-                for title, earnings in top5releases_e.items():
-                    st.markdown(top_5_styling(title, f"${round(earnings, 2):,}"), unsafe_allow_html=True)
+                top5releases_e = top5['Title']['Earnings']
+                st.html(list_html(top5releases_e.index, top5releases_e.round(2).map('${:,}'.format)))
                 st.write('') # Empty for spacing
 
                 st.header('') # Empty for spacing
                 st.subheader('Earnings (USD)')
-                top5countries_e = cad[cad['Country'] != 'Unknown'].groupby('Country')['Earnings'].sum().sort_values(ascending = False).head()
-                for country, earnings in top5countries_e.items():
-                    st.markdown(top_5_styling(country, f"${round(earnings, 2):,}"), unsafe_allow_html=True)
+                top5countries_e = top5['Country']['Earnings']
+                st.html(list_html(top5countries_e.index, top5countries_e.round(2).map('${:,}'.format)))
                 st.write('') # Empty for spacing
 
                 st.header('') # Empty for spacing
                 st.subheader('Earnings (USD)')
-                top5platforms_e = cad.groupby('Store')['Earnings'].sum().sort_values(ascending = False).head()
-                for store, earnings in top5platforms_e.items():
-                    st.markdown(top_5_styling(store, f"${round(earnings, 2):,}"), unsafe_allow_html=True)
+                top5platforms_e = top5['Store']['Earnings']
+                st.html(list_html(top5platforms_e.index, top5platforms_e.round(2).map('${:,}'.format)))
 
         elif st.session_state.current_page == 'Streams':
             st.title('Streaming Metrics')
@@ -259,23 +373,8 @@ else:
 
             with c1:
                 st.subheader('Stream Distribution by Platform')
-                platform_streams = cad.groupby('Store')['Quantity'].sum().sort_values(ascending = False).reset_index()
-                total_streams = platform_streams['Quantity'].sum()
-                platform_streams['Percentage'] = (platform_streams['Quantity'] / total_streams) * 100
-                
-                threshold = 3
-                large_stores = platform_streams[platform_streams['Percentage'] >= threshold]
-                small_stores = platform_streams[platform_streams['Percentage'] < threshold]
-
-                # Combine small stores into 'Other'
-                other_row = pd.DataFrame({
-                    'Store': ['Other'],
-                    'Quantity': [small_stores['Quantity'].sum()],
-                    'Percentage': [small_stores['Percentage'].sum()]
-                })
-
-                # Append the 'Other' category to large stores
-                platform_data = pd.concat([large_stores, other_row], ignore_index=True)
+                # Stores under 3% are combined into 'Other'
+                platform_data = window_shares(months, 'Quantity', threshold=3, start=start, stop=stop)
                 
                 fig = px.pie(
                     platform_data, 
@@ -288,12 +387,9 @@ else:
                 fig.update_traces(textinfo='percent+label', hole=0.4)
                 st.plotly_chart(fig, use_container_width=True)
 
-            cad['Reporting Date'] = pd.to_datetime(cad['Reporting Date'], format = '%m/%d/%Y')
-            cad['Year'] = cad['Reporting Date'].dt.year
-
             with c2:
                 st.subheader('Total Streams by Year')
-                yearly_streams = cad.groupby('Year')['Quantity'].sum().reset_index()
+                yearly_streams = window_totals(months, 'Year', 'Quantity', start, stop)
 
                 fig = px.bar(
                     yearly_streams,
@@ -304,10 +400,7 @@ else:
                 st.plotly_chart(fig, use_container_width=True)
 
             st.subheader('Total Streams by Month')
-            cad['Sale Month'] = pd.to_datetime(cad['Sale Month'], format='%Y-%m')
-            cad['Month'] = cad['Sale Month'].dt.to_period('M') 
-            monthly_streams = cad.groupby('Month')['Quantity'].sum().reset_index()
-            monthly_streams['Month'] = monthly_streams['Month'].dt.to_timestamp()
+            monthly_streams = window_totals(months, 'Month', 'Quantity', start, stop)
             
             fig = px.line(
                 monthly_streams, x='Month', y='Quantity',
@@ -319,32 +412,13 @@ else:
             st.plotly_chart(fig, use_container_width=True)
 
             st.header('Release Analysis')
-            selected_title = st.selectbox('Release:', options=cad['Title'].unique())
+            releases = release_lookup(dataset, rollup)
+            selected_title = st.selectbox('Release:', options=releases['titles'])
             c1a, c2a, c3a = st.columns(3)
 
             with c1a:
-                title_data = cad[cad['Title'] == selected_title]
-                platform_title_streams = title_data.groupby('Store')['Quantity'].sum().sort_values(ascending=False).reset_index()
-
-                # Calculate total streams and percentage contribution
-                total_streams = title_data['Quantity'].sum()
-                platform_title_streams['Percentage'] = (platform_title_streams['Quantity'] / total_streams) * 100
-
-                # Threshold for grouping small stores into 'Other'
-                threshold = 1.5
-                large_stores = platform_title_streams[platform_title_streams['Percentage'] >= threshold]
-                small_stores = platform_title_streams[platform_title_streams['Percentage'] < threshold]
-
-                # Combine small stores into 'Other' if necessary
-                if not small_stores.empty:
-                    other_row = pd.DataFrame({
-                        'Store': ['Other'],
-                        'Quantity': [small_stores['Quantity'].sum()],
-                        'Percentage': [small_stores['Percentage'].sum()]
-                    })
-                    title_stream_data = pd.concat([large_stores, other_row], ignore_index=True)
-                else:
-                    title_stream_data = large_stores
+                # Stores under 1.5% are combined into 'Other'
+                title_stream_data = release_shares(releases, selected_title, 'Quantity', threshold=1.5)
 
                 # Sort so "Other" appears last
                 title_stream_data = title_stream_data.sort_values(by='Store', ascending=True)
@@ -371,15 +445,14 @@ else:
                 st.plotly_chart(fig, use_container_width=True)
 
             with c2a:
-                yearly_streams = title_data.groupby('Year')['Quantity'].sum().reset_index()
+                yearly_streams = release_totals(releases, selected_title, 'Year', 'Quantity')
                 fig_year = px.bar(yearly_streams, x='Year', y='Quantity', title="Streams by Year",
                                 labels={'Quantity': 'Total Streams', 'Year': 'Year'},
                                 color='Year')
                 st.plotly_chart(fig_year, use_container_width=True)
 
             with c3a:
-                title_monthly_streams = title_data.groupby('Month')['Quantity'].sum().reset_index()
-                title_monthly_streams['Month'] = title_monthly_streams['Month'].dt.to_timestamp()
+                title_monthly_streams = release_totals(releases, selected_title, 'Month', 'Quantity')
                 
                 fig = px.line(
                     title_monthly_streams, x='Month', y='Quantity',
@@ -393,30 +466,12 @@ else:
 
 
             st.subheader('All Releases')
-            def release_styling(title, value):
-                return f"""
-                <div style="display: flex; align-items: center; margin-bottom: 10px;">
-                    <div style="font-size: 20px; font-weight: bold; color: white; text-align: left; width: fit-content;">
-                        {title}
-                    </div>
-                    <div style="flex-grow: 1; height: 2px; background-image: linear-gradient(to right, white, #37faa9); margin: 0 10px;"></div>
-                    <div style="font-size: 16px; font-weight: bold; color: #37faa9; text-align: right; width: fit-content;">
-                        {value:,}
-                    </div>
-                </div>
-                """
+            release_summary = title_summary(rollup, 'Quantity')
 
-            earliest_year = cad.groupby('Title')['Year'].min().reset_index()
-            total_streams = cad.groupby('Title')['Quantity'].sum().reset_index()
-            title_summary = pd.merge(earliest_year, total_streams, on='Title')
-            title_summary = title_summary.sort_values(by=['Year', 'Quantity'], ascending=[True, False])
-
-            current_year = None
-            for _, row in title_summary.iterrows():
-                if row['Year'] != current_year:
-                    st.markdown(f"<div style='font-size: 24px; font-weight: bold; color: #37faa9; margin-top: 20px;'>{row['Year']}</div>", unsafe_allow_html=True)
-                    current_year = row['Year']
-                st.markdown(release_styling(row['Title'], row['Quantity']), unsafe_allow_html=True)
+            # The whole catalog goes out as one element, grouped under each release's first year
+            st.html(grouped_list_html(
+                release_summary['Year'], release_summary['Title'], release_summary['Quantity'].map('{:,}'.format)
+            ))
 
 
         elif st.session_state.current_page == 'Earnings':
@@ -426,24 +481,8 @@ else:
 
             with c1:
                 st.subheader('Earning Distribution by Platform')
-                platform_earnings = cad.groupby('Store')['Earnings'].sum().sort_values(ascending = False).reset_index()
-                platform_earnings['Earnings'] = platform_earnings['Earnings'].round(2)
-                total_earnings = platform_earnings['Earnings'].sum()
-                platform_earnings['Percentage'] = (platform_earnings['Earnings'] / total_earnings) * 100
-                
-                threshold = 3
-                large_stores = platform_earnings[platform_earnings['Percentage'] >= threshold]
-                small_stores = platform_earnings[platform_earnings['Percentage'] < threshold]
-
-                # Combine small stores into 'Other'
-                other_row = pd.DataFrame({
-                    'Store': ['Other'],
-                    'Earnings': [small_stores['Earnings'].sum()],
-                    'Percentage': [small_stores['Percentage'].sum()]
-                })
-
-                # Append the 'Other' category to large stores
-                platform_data = pd.concat([large_stores, other_row], ignore_index=True)
+                # Stores under 3% are combined into 'Other'
+                platform_data = window_shares(months, 'Earnings', threshold=3, start=start, stop=stop, decimals=2)
                 
                 fig = px.pie(
                     platform_data, 
@@ -456,13 +495,9 @@ else:
                 fig.update_traces(textinfo='percent+label', hole=0.4)
                 st.plotly_chart(fig, use_container_width=True)
 
-            cad['Reporting Date'] = pd.to_datetime(cad['Reporting Date'], format = '%m/%d/%Y')
-            cad['Year'] = cad['Reporting Date'].dt.year
-
             with c2:
                 st.subheader('Total Earnings by Year')
-                yearly_earnings = cad.groupby('Year')['Earnings'].sum().reset_index()
-                yearly_earnings['Earnings'] = yearly_earnings['Earnings'].round(2)
+                yearly_earnings = window_totals(months, 'Year', 'Earnings', start, stop, decimals=2)
 
                 fig = px.bar(
                     yearly_earnings,
@@ -473,11 +508,7 @@ else:
                 st.plotly_chart(fig, use_container_width=True)
 
             st.subheader('Total Earnings by Month')
-            cad['Sale Month'] = pd.to_datetime(cad['Sale Month'], format='%Y-%m')
-            cad['Month'] = cad['Sale Month'].dt.to_period('M') 
-            monthly_earnings = cad.groupby('Month')['Earnings'].sum().reset_index()
-            monthly_earnings['Earnings'] = monthly_earnings['Earnings'].round(2)
-            monthly_earnings['Month'] = monthly_earnings['Month'].dt.to_timestamp()
+            monthly_earnings = window_totals(months, 'Month', 'Earnings', start, stop, decimals=2)
             
             fig = px.line(
                 monthly_earnings, x='Month', y='Earnings',
@@ -489,30 +520,13 @@ else:
             st.plotly_chart(fig, use_container_width=True)
 
             st.header('Release Analysis')
-            selected_title = st.selectbox('Release:', options=cad['Title'].unique())
+            releases = release_lookup(dataset, rollup)
+            selected_title = st.selectbox('Release:', options=releases['titles'])
             c1a, c2a, c3a = st.columns(3)
 
             with c1a:
-                title_data = cad[cad['Title'] == selected_title]
-                platform_title_earnings = title_data.groupby('Store')['Earnings'].sum().sort_values(ascending=False).reset_index()
-                platform_title_earnings['Earnings'] = platform_title_earnings['Earnings'].round(2)
-
-                total_earnings = title_data['Earnings'].sum()
-                platform_title_earnings['Percentage'] = (platform_title_earnings['Earnings'] / total_earnings) * 100
-
-                threshold = 1.5
-                large_stores = platform_title_earnings[platform_title_earnings['Percentage'] >= threshold]
-                small_stores = platform_title_earnings[platform_title_earnings['Percentage'] < threshold]
-
-                if not small_stores.empty:
-                    other_row = pd.DataFrame({
-                        'Store': ['Other'],
-                        'Earnings': [small_stores['Earnings'].sum()],
-                        'Percentage': [small_stores['Percentage'].sum()]
-                    })
-                    title_earning_data = pd.concat([large_stores, other_row], ignore_index=True)
-                else:
-                    title_earning_data = large_stores
+                # Stores under 1.5% are combined into 'Other'
+                title_earning_data = release_shares(releases, selected_title, 'Earnings', threshold=1.5, decimals=2)
 
                 title_earning_data = title_earning_data.sort_values(by='Store', ascending=True)
 
@@ -537,16 +551,14 @@ else:
                 st.plotly_chart(fig, use_container_width=True)
 
             with c2a:
-                yearly_earnings = title_data.groupby('Year')['Earnings'].sum().reset_index()
-                yearly_earnings['Earnings'] = yearly_earnings['Earnings'].round(2)
+                yearly_earnings = release_totals(releases, selected_title, 'Year', 'Earnings', decimals=2)
                 fig_year = px.bar(yearly_earnings, x='Year', y='Earnings', title="Earnings by Year",
                                 labels={'Earnings': 'Total Earnings', 'Year': 'Year'},
                                 color='Year')
                 st.plotly_chart(fig_year, use_container_width=True)
 
             with c3a:
-                title_monthly_streams = title_data.groupby('Month')['Earnings'].sum().reset_index()
-                title_monthly_streams['Month'] = title_monthly_streams['Month'].dt.to_timestamp()
+                title_monthly_streams = release_totals(releases, selected_title, 'Month', 'Earnings')
                 
                 fig = px.line(
                     title_monthly_streams, x='Month', y='Earnings',
@@ -560,31 +572,12 @@ else:
 
 
             st.subheader('All Releases (USD)')
-            def release_styling(title, value):
-                return f"""
-                <div style="display: flex; align-items: center; margin-bottom: 10px;">
-                    <div style="font-size: 20px; font-weight: bold; color: white; text-align: left; width: fit-content;">
-                        {title}
-                    </div>
-                    <div style="flex-grow: 1; height: 2px; background-image: linear-gradient(to right, white, #37faa9); margin: 0 10px;"></div>
-                    <div style="font-size: 16px; font-weight: bold; color: #37faa9; text-align: right; width: fit-content;">
-                        ${value:,}
-                    </div>
-                </div>
-                """
+            release_summary = title_summary(rollup, 'Earnings', decimals=2)
 
-            earliest_year = cad.groupby('Title')['Year'].min().reset_index()
-            total_earnings = cad.groupby('Title')['Earnings'].sum().reset_index()
-            total_earnings['Earnings'] = total_earnings['Earnings'].round(2)
-            title_summary = pd.merge(earliest_year, total_earnings, on='Title')
-            title_summary = title_summary.sort_values(by=['Year', 'Earnings'], ascending=[True, False])
-
-            current_year = None
-            for _, row in title_summary.iterrows():
-                if row['Year'] != current_year:
-                    st.markdown(f"<div style='font-size: 24px; font-weight: bold; color: #37faa9; margin-top: 20px;'>{row['Year']}</div>", unsafe_allow_html=True)
-                    current_year = row['Year']
-                st.markdown(release_styling(row['Title'], row['Earnings']), unsafe_allow_html=True)
+            # The whole catalog goes out as one element, grouped under each release's first year
+            st.html(grouped_list_html(
+                release_summary['Year'], release_summary['Title'], release_summary['Earnings'].map('${:,}'.format)
+            ))
 
         # elif st.session_state.current_page == 'Marketing':
         #     st.title('Marketing Strategies')
@@ -595,14 +588,7 @@ else:
             st.title('Platform Analysis')
 
             selected_stores = ['Spotify', 'Apple Music', 'Amazon Unlimited (Streaming)', 'YouTube (Ads)', 'YouTube (Red)']
-            aes_plat = cad[cad['Store'].isin(selected_stores)]
-            aes_plat = aes_plat.groupby('Store').agg({
-                'Earnings' : 'sum',
-                'Quantity' : 'sum'
-            })
-            aes_plat['AES'] = aes_plat['Earnings'] / aes_plat['Quantity']
-            aes_plat = aes_plat.reset_index()
-            aes_plat_top5 = aes_plat.sort_values(by='AES', ascending=False)
+            aes_plat_top5 = store_aes(rollup, selected_stores)
             st.subheader('Most Popular Platforms (AES)')
             fig = px.bar(
                 aes_plat_top5, x = 'AES', y = 'Store', color = 'Store',
@@ -612,15 +598,7 @@ else:
             fig.update_layout(xaxis_title = 'AES ($USD)', yaxis_title = 'Platform', xaxis=dict(side="top"))
             st.plotly_chart(fig, use_container_width=True)
             
-            cad['Sale Month'] = pd.to_datetime(cad['Sale Month'], format='%Y-%m')
-            cad['Month'] = cad['Sale Month'].dt.to_period('M')
-            cad['Month'] = cad['Month'].dt.to_timestamp() 
-
-            aes_platform_m = cad.groupby(['Month','Store']).agg({
-                'Earnings' : 'sum',
-                'Quantity' : 'sum'
-            }).reset_index()
-            aes_platform_m['AES'] = aes_platform_m['Earnings'] / aes_platform_m['Quantity']
+            aes_platform_m = platform_aes_by_month(rollup)
 
 
             st.subheader('Platform AES by Month')
@@ -633,36 +611,44 @@ else:
             fig.update_traces(fill='tozeroy', opacity=0.2, mode='lines+markers')
             st.plotly_chart(fig, use_container_width=True)
 
-            st.subheader('12-Month Forecast: Spotify')
-
-            # Preprocessing
-            stores = aes_platform_m['Store'].unique()
-            stores_df = {store : aes_platform_m[aes_platform_m['Store'] == store].copy() for store in stores}
-
             # Separate analysis showed promise in Spotify and Apple Music
-            spotify_data = stores_df['Spotify']
-            # Rename for sake of Prophet model
-            spotify_data.rename(columns={'Month': 'ds', 'AES': 'y'}, inplace = True)
-            # Fitting the model
-            spotify_model = Prophet()
-            spotify_model.fit(spotify_data)
-
-            future_year = spotify_model.make_future_dataframe(periods=12, freq='ME')
-            # Generate predctions
-            spotify_forecast = spotify_model.predict(future_year)
-            last_train_date = spotify_data['ds'].max()
-            forecast_spotify_df = spotify_forecast[spotify_forecast['ds'] > last_train_date][['ds', 'yhat']].rename(columns={'ds': 'Month', 'yhat': 'AES'})
-            forecast_spotify_df['AES_Text'] = forecast_spotify_df['AES'].apply(lambda x: f"${x:.4f}")
-            
-            fig = px.line(
-                forecast_spotify_df, x = 'Month', y = 'AES',
-                labels = {'AES': 'AES', 'Month': 'Month'},
-                line_shape = 'spline'
+            forecast_stores = list(store_histories(aes_platform_m))
+            selected_forecast_stores = st.multiselect(
+                'Forecast platforms:', options=forecast_stores,
+                default=[store for store in ['Spotify', 'Apple Music'] if store in forecast_stores]
             )
-            fig.update_traces(fill='tozeroy', fillcolor='rgba(186, 247, 221, 0.5)', opacity=0.2, line=dict(color='#37faa9'), 
-                              mode = 'lines+markers+text', text=forecast_spotify_df['AES_Text'], textposition='top center')
-            st.plotly_chart(fig)
 
-            st.write("These forecasts are created using your streaming data. This forecast utilizes Meta's Prophet model.")            
-            st.subheader('12-Month Forecast: Apple Music')
-            st.write('Work in progress.')
\ No newline at end of file
+            # Fits for the selected stores run in parallel and are cached
+            platform_forecasts = forecast_platforms(aes_platform_m, periods=12, freq='ME', stores=selected_forecast_stores)
+            platform_forecasts['AES_Text'] = platform_forecasts['AES'].apply(lambda x: f"${x:.4f}")
+
+            for store in selected_forecast_stores:
+                st.subheader(f'12-Month Forecast: {store}')
+                store_forecast = platform_forecasts[platform_forecasts['Store'] == store]
+
+                fig = px.line(
+                    store_forecast, x = 'Month', y = 'AES',
+                    labels = {'AES': 'AES', 'Month': 'Month'},
+                    line_shape = 'spline'
+                )
+                fig.update_traces(fill='tozeroy', fillcolor='rgba(186, 247, 221, 0.5)', opacity=0.2, line=dict(color='#37faa9'), 
+                                  mode = 'lines+markers+text', text=store_forecast['AES_Text'], textposition='top center')
+                st.plotly_chart(fig)
+
+            st.write(f"These forecasts are created using your streaming data. This forecast utilizes {FORECASTER_LABELS[DEFAULT_FORECASTER]}.")
+
+running = ingest_job(st.session_state['dataset']) if st.session_state['dataset'] is not None else None
+if running is not None and not running.done:
+    with st.sidebar:
+        ingest_progress(st.session_state['dataset'])
+
+if tracing:
+    with st.sidebar.expander('Timings', expanded=True):
+        st.caption(f'Whole rerun: {time.perf_counter() - rerun_started:.3f} s, including charts and rendering')
+        # Spans are listed as they finish, so nested spans come before the span around them
+        st.dataframe(
+            [{**record, 'span': '· ' * record['depth'] + record['span']} for record in trace_records],
+            column_order=['span', 'seconds', 'rows', 'memory_delta_mib'], hide_index=True, use_container_width=True
+        )
+        st.caption('Process-wide dataset caches')
+        st.dataframe([ingest_cache.stats(), rollup_cache.stats()], hide_index=True, use_container_width=True)
@@ -0,0 +1 @@
+"""Streamlit-independent building blocks for the Snapshot dashboard."""
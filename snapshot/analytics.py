@@ -0,0 +1,306 @@
+"""Dashboard metrics computed from the rollup, independent of Streamlit.
+
+Every function takes the per (Month, Year, Store, Title, Country) rollup, or a slice of
+it such as one release's rows, and returns plain pandas objects that the dashboard
+plots and the batch report runner serialises. The release_* and window_* variants
+answer the same questions from indexes built once per rollup (release_index and
+month_index), for one release or a range of sale months.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from snapshot.forecast import forecast_platforms
+from snapshot.trace import traced
+
+
+def key_metrics(rollup):
+    """Total streams, total earnings and average earnings per stream."""
+    total_streams = int(rollup['Quantity'].sum())
+    total_earnings = float(rollup['Earnings'].sum())
+    avg_eps = total_earnings / total_streams if total_streams else float('nan')
+    return {'total_streams': total_streams, 'total_earnings': total_earnings, 'avg_eps': avg_eps}
+
+
+@traced
+def top_n_per_metric(rollup, by, metrics=('Quantity', 'Earnings'), n=5):
+    """The ``n`` largest totals of each of ``metrics`` per ``by``, as {metric: Series}, from one groupby.
+
+    Sales with an unknown country are left out.
+    """
+    totals = rollup.groupby(by, observed=True)[list(metrics)].sum()
+    return largest_totals(totals.index, {metric: totals[metric].to_numpy() for metric in metrics}, by, n)
+
+
+def largest_totals(labels, totals, by, n):
+    """The ``n`` largest of each array in ``totals`` as a Series indexed by ``labels``, largest first.
+
+    Only the winners are sorted: np.argpartition finds them in linear time. Ties go to the
+    earlier label, so the lists don't change between reruns.
+    """
+    # Sales with an unknown country are left out
+    keep = ~labels.isin(['Unknown']) if by == 'Country' else np.ones(len(labels), dtype=bool)
+    tops = {}
+    for metric, values in totals.items():
+        positions = np.flatnonzero(keep)
+        if len(positions) > n:
+            candidates = values[positions]
+            cutoff = candidates[np.argpartition(candidates, len(candidates) - n)[len(candidates) - n]]
+            above = positions[candidates > cutoff]
+            positions = np.concatenate([above, positions[candidates == cutoff][:n - len(above)]])
+        positions = positions[np.lexsort((positions, -values[positions]))]
+        tops[metric] = pd.Series(values[positions], index=labels[positions], name=metric).rename_axis(by)
+    return tops
+
+
+def share_table(totals, metric, threshold, decimals=None):
+    """Per-store totals and percentage share, largest first, from a Series of ``metric`` indexed by Store.
+
+    Stores below ``threshold`` percent are folded into a trailing 'Other' row.
+    """
+    shares = totals.sort_values(ascending=False).rename(metric).rename_axis('Store').reset_index()
+    if decimals is not None:
+        shares[metric] = shares[metric].round(decimals)
+    shares['Percentage'] = (shares[metric] / shares[metric].sum()) * 100
+
+    large_stores = shares[shares['Percentage'] >= threshold]
+    small_stores = shares[shares['Percentage'] < threshold]
+    if small_stores.empty:
+        return large_stores
+    other_row = pd.DataFrame({
+        'Store': ['Other'],
+        metric: [small_stores[metric].sum()],
+        'Percentage': [small_stores['Percentage'].sum()]
+    })
+    return pd.concat([large_stores, other_row], ignore_index=True)
+
+
+@traced
+def monthly_totals(frame, metric, decimals=None):
+    """Totals per sale month, with Month as timestamps for plotting."""
+    monthly = frame.groupby('Month')[metric].sum().reset_index()
+    if decimals is not None:
+        monthly[metric] = monthly[metric].round(decimals)
+    monthly['Month'] = monthly['Month'].dt.to_timestamp()
+    return monthly
+
+
+def release_titles(rollup):
+    return rollup['Title'].unique()
+
+
+# Breakdowns the Release Analysis charts show for one release
+RELEASE_BREAKDOWNS = ['Store', 'Year', 'Month']
+
+
+@traced
+def release_index(rollup):
+    """Per-release totals of Quantity and Earnings by Store, Year and Month, built once per dataset.
+
+    Each breakdown is indexed by (Title, ...) and sorted, so one release's totals are a
+    contiguous slice found by binary search. Also holds the release titles in the order
+    release_titles gives them.
+    """
+    index = {'titles': release_titles(rollup)}
+    for by in RELEASE_BREAKDOWNS:
+        index[by] = rollup.groupby(['Title', by], observed=True)[['Quantity', 'Earnings']].sum().sort_index()
+    return index
+
+
+def release_breakdown(index, title, by, metric):
+    """One release's ``metric`` per ``by`` as a Series, sliced out of the release index."""
+    totals = index[by]
+    try:
+        rows = totals.index.get_loc(title)
+    except KeyError:
+        return totals[metric].iloc[:0].droplevel('Title')
+    return totals[metric].iloc[rows].droplevel('Title')
+
+
+def release_totals(index, title, by, metric, decimals=None):
+    """One release's ``metric`` per reporting year (``by='Year'``) or sale month (``by='Month'``, as timestamps)."""
+    totals = release_breakdown(index, title, by, metric).reset_index()
+    if decimals is not None:
+        totals[metric] = totals[metric].round(decimals)
+    if by == 'Month':
+        totals['Month'] = totals['Month'].dt.to_timestamp()
+    return totals
+
+
+def release_shares(index, title, metric, threshold, decimals=None):
+    """share_table of one release's ``metric`` per store."""
+    return share_table(release_breakdown(index, title, 'Store', metric), metric, threshold, decimals)
+
+
+# Breakdowns a sale month range can be answered for from the month index
+WINDOW_BREAKDOWNS = ['Title', 'Country', 'Store', 'Year']
+
+
+@traced
+def month_index(rollup):
+    """Running totals of Quantity and Earnings over the sale months, built once per dataset.
+
+    Row ``i`` of each array holds the totals of every period before ``i``, where the
+    periods are rows without a sale month followed by each month in order. A range's
+    totals are then the difference of two rows found by binary search, for the whole
+    rollup ('All') and per value of each of WINDOW_BREAKDOWNS (one column per value, in
+    ``labels``). 'Rows' counts rollup rows, so values with no sales in a range can be
+    told apart from ones that sum to zero. 'Month' holds the plain totals of each month.
+    """
+    months = pd.PeriodIndex(rollup['Month'].dropna().unique()).sort_values()
+    periods = pd.PeriodIndex([pd.NaT], freq='M').append(months)
+    index = {'months': months}
+    for by in ['All'] + WINDOW_BREAKDOWNS:
+        keys = ['Month'] if by == 'All' else ['Month', by]
+        totals = rollup.groupby(keys, observed=True, dropna=False).agg(
+            Quantity=('Quantity', 'sum'), Earnings=('Earnings', 'sum'), Rows=('Quantity', 'size')
+        )
+        if by != 'All' and totals.empty:
+            # An empty rollup (a header-only export, or one whose dates were all invalid)
+            # has no values to unstack, so each array gets no columns and every range is empty
+            index[by] = {'labels': pd.Index([], name=by), **{
+                column: np.zeros((len(periods) + 1, 0), dtype=totals[column].dtype)
+                for column in ['Quantity', 'Earnings', 'Rows']
+            }}
+            continue
+        if by != 'All':
+            totals = totals.unstack(by, fill_value=0)
+        totals = totals.reindex(periods, fill_value=0)
+        if by == 'All':
+            index['Month'] = totals.iloc[1:].rename_axis('Month')
+        # Plain arrays with a leading row of zeros, so every range is a difference of two rows
+        running = {'labels': None if by == 'All' else totals['Rows'].columns}
+        for column in ['Quantity', 'Earnings', 'Rows']:
+            values = totals[column].to_numpy()
+            running[column] = np.concatenate([np.zeros_like(values[:1]), values.cumsum(axis=0)])
+        index[by] = running
+    return index
+
+
+def window_rows(index, start=None, stop=None):
+    """The pair of month index rows whose difference covers ``start`` to ``stop``, inclusive.
+
+    Both ends are monthly Periods, or None for the first or last month. Rows without a
+    sale month only count when neither end is given.
+    """
+    months = index['months']
+    if start is None and stop is None:
+        return 0, len(months) + 1
+    lo = 0 if start is None else months.searchsorted(start, side='left')
+    hi = len(months) if stop is None else months.searchsorted(stop, side='right')
+    return 1 + lo, 1 + max(lo, hi)
+
+
+def window_sum(index, by, column, start=None, stop=None):
+    """Total ``column`` (Quantity, Earnings or Rows) between ``start`` and ``stop``, per ``by`` unless it is 'All'."""
+    running = index[by]
+    lo, hi = window_rows(index, start, stop)
+    totals = running[column][hi] - running[column][lo]
+    return totals if running['labels'] is None else pd.Series(totals, index=running['labels'])
+
+
+def window_metrics(index, start=None, stop=None):
+    """key_metrics of the rollup rows between ``start`` and ``stop``."""
+    total_streams = int(window_sum(index, 'All', 'Quantity', start, stop))
+    total_earnings = float(window_sum(index, 'All', 'Earnings', start, stop))
+    avg_eps = total_earnings / total_streams if total_streams else float('nan')
+    return {'total_streams': total_streams, 'total_earnings': total_earnings, 'avg_eps': avg_eps}
+
+
+def window_breakdown(index, by, metric, start=None, stop=None):
+    """Total ``metric`` per ``by`` between ``start`` and ``stop``, for the values with sales in it."""
+    running = index[by]
+    lo, hi = window_rows(index, start, stop)
+    present = running['Rows'][hi] > running['Rows'][lo]
+    totals = running[metric][hi][present] - running[metric][lo][present]
+    return pd.Series(totals, index=running['labels'][present], name=metric)
+
+
+def window_top_n_per_metric(index, by, metrics=('Quantity', 'Earnings'), start=None, stop=None, n=5):
+    """top_n_per_metric of the rollup rows between ``start`` and ``stop``."""
+    running = index[by]
+    lo, hi = window_rows(index, start, stop)
+    present = running['Rows'][hi] > running['Rows'][lo]
+    totals = {metric: running[metric][hi][present] - running[metric][lo][present] for metric in metrics}
+    return largest_totals(running['labels'][present], totals, by, n)
+
+
+def window_shares(index, metric, threshold, start=None, stop=None, decimals=None):
+    """share_table of ``metric`` per store between ``start`` and ``stop``."""
+    return share_table(window_breakdown(index, 'Store', metric, start, stop), metric, threshold, decimals)
+
+
+def window_totals(index, by, metric, start=None, stop=None, decimals=None):
+    """``metric`` per reporting year (``by='Year'``) or sale month (``by='Month'``, as timestamps).
+
+    Only the rollup rows between ``start`` and ``stop`` are counted.
+    """
+    if by == 'Month':
+        lo, hi = window_rows(index, start, stop)
+        totals = index['Month'][metric].iloc[max(lo, 1) - 1:hi - 1].reset_index()
+    else:
+        totals = window_breakdown(index, by, metric, start, stop).reset_index()
+    if decimals is not None:
+        totals[metric] = totals[metric].round(decimals)
+    if by == 'Month':
+        totals['Month'] = totals['Month'].dt.to_timestamp()
+    return totals
+
+
+@traced
+def title_summary(rollup, metric, decimals=None):
+    """Each release's first reporting year and total ``metric``, by year and then largest first."""
+    earliest_year = rollup.groupby('Title', observed=True)['Year'].min().reset_index()
+    totals = rollup.groupby('Title', observed=True)[metric].sum().reset_index()
+    if decimals is not None:
+        totals[metric] = totals[metric].round(decimals)
+    summary = pd.merge(earliest_year, totals, on='Title')
+    return summary.sort_values(by=['Year', metric], ascending=[True, False])
+
+
+@traced
+def store_aes(rollup, stores=None):
+    """Earnings, Quantity and AES per store, highest AES first."""
+    if stores is not None:
+        rollup = rollup[rollup['Store'].isin(stores)]
+    aes_plat = rollup.groupby('Store', observed=True).agg({
+        'Earnings': 'sum',
+        'Quantity': 'sum'
+    })
+    aes_plat['AES'] = aes_plat['Earnings'] / aes_plat['Quantity']
+    return aes_plat.reset_index().sort_values(by='AES', ascending=False)
+
+
+@traced
+def platform_aes_by_month(rollup):
+    """Earnings, Quantity and AES per Month (as timestamps) and Store."""
+    aes_platform_m = rollup.groupby(['Month', 'Store'], observed=True).agg({
+        'Earnings': 'sum',
+        'Quantity': 'sum'
+    }).reset_index()
+    aes_platform_m['Month'] = aes_platform_m['Month'].dt.to_timestamp()
+    aes_platform_m['AES'] = aes_platform_m['Earnings'] / aes_platform_m['Quantity']
+    return aes_platform_m
+
+
+def _records(frame):
+    # to_json takes care of numpy scalars, timestamps and NaN
+    return json.loads(frame.to_json(orient='records', date_format='iso'))
+
+
+def artist_summary(rollup, periods=12, model=None):
+    """Everything the dashboard shows for one export, as JSON-serialisable data."""
+    aes_platform_m = platform_aes_by_month(rollup)
+    return {
+        **key_metrics(rollup),
+        'top_5': {
+            by: {metric: _records(top.reset_index()) for metric, top in top_n_per_metric(rollup, by).items()}
+            for by in ['Title', 'Country', 'Store']
+        },
+        'yearly': _records(rollup.groupby('Year')[['Quantity', 'Earnings']].sum().reset_index()),
+        'monthly': _records(monthly_totals(rollup, ['Quantity', 'Earnings'])),
+        'store_aes': _records(store_aes(rollup)),
+        # The report runner already works on several exports in parallel, so fit stores one by one
+        'forecast': _records(forecast_platforms(aes_platform_m, periods=periods, model=model, max_workers=1)),
+    }
@@ -0,0 +1,152 @@
+"""Rolling-origin backtests of the monthly AES forecasts.
+
+Each store's history is cut at a series of origins, ``step`` months apart, the latest
+``horizon`` months before its last month. A forecast fitted on the months up to an
+origin is scored (MAPE, RMSE) on the ``horizon`` months after it; months with zero AES
+are left out of MAPE and counted instead. Every store, setting and origin is an
+independent fit, so they run in parallel worker processes. Fold forecasts go into the
+forecast cache under a fingerprint of their training months and settings, so rerunning,
+or running again once more months are in, only fits new folds.
+
+A setting is a backend name plus keyword options for it, written the way
+``parse_setting`` reads them: ``ets``, ``ets damped_trend=False``,
+``prophet changepoint_prior_scale=0.5``.
+"""
+import ast
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from snapshot.forecast import (
+    FORECASTERS, MIN_HISTORY_MONTHS, fit_forecast, forecast_cache, forecast_errors, forecast_key, store_histories
+)
+
+logger = logging.getLogger(__name__)
+
+# Month values are month starts, so forecasts are made on month starts to line up with them
+BACKTEST_FREQ = 'MS'
+
+
+def parse_setting(text):
+    """``'prophet changepoint_prior_scale=0.5'`` -> ``{'model': 'prophet', 'changepoint_prior_scale': 0.5}``."""
+    model, *options = text.split()
+    if model not in FORECASTERS:
+        raise ValueError(f'Unknown forecaster {model!r}; choose one of {", ".join(FORECASTERS)}')
+    setting = {'model': model}
+    for option in options:
+        name, _, value = option.partition('=')
+        try:
+            setting[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            # Bare words such as seasonality_mode=multiplicative
+            setting[name] = value
+    return setting
+
+
+def setting_label(setting):
+    return ' '.join([setting['model']] + [f'{name}={value}' for name, value in setting.items() if name != 'model'])
+
+
+def rolling_folds(history, horizon=12, folds=6, step=1, min_history=MIN_HISTORY_MONTHS):
+    """Training and test months of up to ``folds`` origins, latest first.
+
+    Origins that would leave fewer than ``min_history`` training months are skipped.
+    """
+    for fold in range(folds):
+        end = len(history) - horizon - fold * step
+        if end < min_history:
+            break
+        yield history.iloc[:end], history.iloc[end:end + horizon]
+
+
+def timed_fit(train, horizon, setting):
+    """fit_forecast for one fold, with its wall time in seconds."""
+    start = time.perf_counter()
+    forecast = fit_forecast(train, horizon, BACKTEST_FREQ, **setting)
+    return forecast, time.perf_counter() - start
+
+
+def backtest(aes_platform_m, settings=None, horizon=12, folds=6, step=1, stores=None,
+             min_history=MIN_HISTORY_MONTHS, max_workers=None):
+    """Rolling-origin backtest of every setting on every store of a Month/Store/AES frame.
+
+    ``settings`` are dicts as parse_setting returns them, by default each backend with
+    its default options. Returns one row per fold: setting, store, origin (the last
+    training month), months scored, mape, rmse, the months left out of mape for a zero
+    actual, and the fitting time in seconds, which is missing for folds read from the
+    cache or sharing another fold's fit.
+    """
+    settings = settings or [{'model': model} for model in FORECASTERS]
+    rows = []
+    # Folds with the same training months and settings (a setting given twice, or stores
+    # with identical histories) share one fit, but each still gets its own row
+    fits = {}
+    waiting = {}
+    for store, history in store_histories(aes_platform_m, min_history + horizon).items():
+        if stores is not None and store not in stores:
+            continue
+        for train, test in rolling_folds(history, horizon, folds, step, min_history):
+            for setting in settings:
+                row = {'setting': setting_label(setting), 'store': store, 'origin': train['ds'].iloc[-1],
+                       'months': len(test)}
+                key = forecast_key(train, periods=horizon, freq=BACKTEST_FREQ, **setting)
+                forecast = forecast_cache.get(key)
+                if forecast is None:
+                    fits.setdefault(key, (train, setting))
+                    waiting.setdefault(key, []).append((row, test))
+                else:
+                    rows.append({**row, **forecast_errors(test, forecast), 'seconds': float('nan')})
+
+    def score(key, forecast, seconds):
+        forecast_cache.put(key, forecast)
+        for row, test in waiting[key]:
+            rows.append({**row, **forecast_errors(test, forecast), 'seconds': seconds})
+            # The fit is timed once, on the first fold that needed it
+            seconds = float('nan')
+
+    def skip(key, exc):
+        for row, _ in waiting[key]:
+            origin = row['origin'].date()
+            logger.warning('Could not backtest %s on %s at %s: %s', row['setting'], row['store'], origin, exc)
+
+    workers = min(len(fits), max_workers or os.cpu_count() or 1)
+    if workers == 1:
+        # Not worth starting worker processes for a single fit or a single core
+        for key, (train, setting) in fits.items():
+            try:
+                score(key, *timed_fit(train, horizon, setting))
+            except (ValueError, RuntimeError) as exc:
+                skip(key, exc)
+    elif fits:
+        # Spawn rather than fork, as forecast_platforms does
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(timed_fit, train, horizon, setting): key for key, (train, setting) in fits.items()}
+            for future in as_completed(futures):
+                try:
+                    score(futures[future], *future.result())
+                except (ValueError, RuntimeError) as exc:
+                    skip(futures[future], exc)
+
+    columns = ['setting', 'store', 'origin', 'months', 'mape', 'rmse', 'zero_actuals', 'seconds']
+    return pd.DataFrame(rows, columns=columns).sort_values(['setting', 'store', 'origin'], ignore_index=True)
+
+
+def backtest_summary(results, by='setting'):
+    """Mean MAPE and RMSE over the folds of each setting (or of each ``by``), best MAPE first.
+
+    ``zero_actuals`` totals the months left out of MAPE because their actual AES was zero.
+    """
+    summary = results.groupby(by).agg(
+        stores=('store', 'nunique'),
+        folds=('store', 'size'),
+        mape=('mape', 'mean'),
+        rmse=('rmse', 'mean'),
+        zero_actuals=('zero_actuals', 'sum'),
+        fitted=('seconds', 'count'),
+        fit_seconds=('seconds', 'sum'),
+    )
+    return summary.sort_values('mape')
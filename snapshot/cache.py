@@ -0,0 +1,178 @@
+"""Two-tier DataFrame cache: an in-memory LRU in front of Parquet files on disk."""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.environ.get('SNAPSHOT_CACHE_DIR', '.snapshot_cache'))
+
+# Memory each dataset cache may use before evicting its least recently used frames
+CACHE_BUDGET_BYTES = int(os.environ.get('SNAPSHOT_CACHE_BUDGET_MB', 1024)) * 1024 ** 2
+
+# Disk each cache directory may use, and how long an unused file is kept, before it is deleted
+CACHE_DISK_BUDGET_BYTES = int(os.environ.get('SNAPSHOT_CACHE_DISK_MB', 4096)) * 1024 ** 2
+CACHE_MAX_AGE_SECONDS = float(os.environ.get('SNAPSHOT_CACHE_MAX_AGE_DAYS', 30)) * 24 * 60 * 60
+
+
+# Bytes of a file hashed at a time, so hashing a large export doesn't read it all into memory
+HASH_CHUNK_BYTES = 8 * 1024 ** 2
+
+
+def content_hash(source):
+    """Stable hex digest of raw file bytes, or of the contents of the file at a path."""
+    if not isinstance(source, (str, os.PathLike)):
+        return hashlib.blake2b(source, digest_size=16).hexdigest()
+    digest = hashlib.blake2b(digest_size=16)
+    with open(source, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FrameCache:
+    """LRU of recently used frames backed by one Parquet file per key.
+
+    The memory tier holds at most ``max_entries`` frames and, if ``max_bytes`` is set,
+    evicts the least recently used ones once their combined size exceeds it (the most
+    recent frame is always kept). Frames handed out are copies unless ``copy=False`` is
+    passed, in which case the cached frame itself is shared and must not be modified.
+
+    Each write prunes the disk tier: files not read or written for ``max_age`` seconds
+    are deleted, then the least recently used ones until the directory fits in
+    ``max_disk_bytes`` (again keeping the most recent one).
+    """
+
+    def __init__(self, name, max_entries=8, max_bytes=None, directory=None,
+                 max_disk_bytes=CACHE_DISK_BUDGET_BYTES, max_age=CACHE_MAX_AGE_SECONDS):
+        self.name = name
+        self.directory = Path(directory or CACHE_DIR) / name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age = max_age
+        self._frames = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return self.directory / f'{key}.parquet'
+
+    def _remember(self, key, frame):
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            self._frames[key] = frame
+            self._sizes[key] = size
+            self._frames.move_to_end(key)
+            while len(self._frames) > 1 and (
+                len(self._frames) > self.max_entries
+                or (self.max_bytes is not None and sum(self._sizes.values()) > self.max_bytes)
+            ):
+                evicted, _ = self._frames.popitem(last=False)
+                del self._sizes[evicted]
+                self.evictions += 1
+
+    def stats(self):
+        """Counters and current size of the memory tier."""
+        with self._lock:
+            return {
+                'cache': self.name,
+                'entries': len(self._frames),
+                'bytes': sum(self._sizes.values()),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def get(self, key, copy=True):
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame.copy() if copy else frame
+
+        path = self._path(key)
+        if not path.exists():
+            self._count_miss()
+            return None
+        try:
+            frame = pd.read_parquet(path)
+        except (OSError, ValueError) as exc:
+            # A truncated or stale file is just a cache miss
+            logger.warning('Ignoring unreadable cache file %s: %s', path, exc)
+            self._count_miss()
+            return None
+        self._remember(key, frame)
+        with self._lock:
+            self.disk_hits += 1
+        # Reading a file counts as using it, so pruning goes by last use rather than age
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return frame.copy() if copy else frame
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key, frame):
+        self._remember(key, frame)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            frame.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError, TypeError) as exc:
+            # The memory tier still works without the disk tier
+            logger.warning('Could not write cache file %s: %s', path, exc)
+            tmp_path.unlink(missing_ok=True)
+        self.prune()
+
+    def prune(self):
+        """Delete cache files past ``max_age``, then the least recently used until under ``max_disk_bytes``."""
+        files = []
+        for path in self.directory.glob('*.parquet'):
+            try:
+                stat = path.stat()
+            except OSError:
+                # Pruned by another process in the meantime
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files[:-1]:
+            if now - mtime <= self.max_age and total <= self.max_disk_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as exc:
+                logger.warning('Could not delete cache file %s: %s', path, exc)
+                continue
+            total -= size
+
+    def get_or_compute(self, key, compute, copy=True):
+        frame = self.get(key, copy)
+        if frame is None:
+            frame = compute()
+            self.put(key, frame)
+            if copy:
+                frame = frame.copy()
+        return frame
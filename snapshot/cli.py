@@ -0,0 +1,118 @@
+"""Headless report runner for a whole roster of DistroKid exports, and forecast backtests.
+
+    python -m snapshot report EXPORT_DIR [--out REPORT_DIR] [--workers N] [--forecaster NAME]
+
+Every ``*.tsv`` in EXPORT_DIR is summarised in its own worker process into
+``REPORT_DIR/<export name>.json``, and the key metrics of all exports are collected in
+``REPORT_DIR/summary.csv``.
+
+    python -m snapshot backtest EXPORT [--setting SETTING ...] [--stores STORE ...] [--horizon 12]
+                                       [--folds 6] [--step 1] [--workers N] [--out FOLDS_CSV]
+
+Backtests the AES forecasts of one export and prints the mean error of each setting;
+see backtest.py.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from snapshot.analytics import artist_summary, platform_aes_by_month
+from snapshot.backtest import backtest, backtest_summary, parse_setting
+from snapshot.forecast import FORECASTERS
+from snapshot.ingest import is_streamed, load_export, load_rollup
+
+logger = logging.getLogger(__name__)
+
+
+def summarize_export(path, out_dir, model=None):
+    """Write the JSON summary of one export and return its key metrics."""
+    # Exports are read from their path, so large ones are streamed rather than loaded whole
+    summary = artist_summary(load_rollup(path), model=model)
+    # Streamed exports have no row-level frame to read the artist names from
+    artists = [] if is_streamed(path) else sorted(load_export(path)['Artist'].dropna().unique().tolist())
+    summary = {'export': path.name, 'artists': artists, **summary}
+    (out_dir / f'{path.stem}.json').write_text(json.dumps(summary, indent=2))
+    return {key: summary[key] for key in ['export', 'total_streams', 'total_earnings', 'avg_eps']}
+
+
+def report(export_dir, out_dir, workers=None, model=None):
+    """Summarise every export in ``export_dir``; returns the paths that failed."""
+    paths = sorted(Path(export_dir).glob('*.tsv'))
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    rows = []
+    failed = []
+    with ProcessPoolExecutor(min(len(paths), workers or os.cpu_count() or 1) or 1) as pool:
+        futures = {pool.submit(summarize_export, path, out_dir, model): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                rows.append(future.result())
+            except (OSError, ValueError, KeyError) as exc:
+                logger.error('Could not summarise %s: %s', path, exc)
+                failed.append(path)
+            else:
+                logger.info('Summarised %s', path.name)
+
+    if rows:
+        pd.DataFrame(rows).sort_values('export').to_csv(out_dir / 'summary.csv', index=False)
+    return failed
+
+
+def run_backtest(args):
+    results = backtest(
+        platform_aes_by_month(load_rollup(args.export)), args.setting, args.horizon, args.folds, args.step, args.stores,
+        max_workers=args.workers
+    )
+    if results.empty:
+        logger.error('No store has enough months of history for a %d-month backtest', args.horizon)
+        return 1
+    if args.out:
+        results.to_csv(args.out, index=False)
+    print(backtest_summary(results).to_string())
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m snapshot', description='Snapshot batch tools.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    report_parser = commands.add_parser('report', help='summarise a directory of DistroKid exports')
+    report_parser.add_argument('export_dir', help='directory containing .tsv exports')
+    report_parser.add_argument('--out', default='reports', help='directory for the summaries (default: reports)')
+    report_parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    report_parser.add_argument('--forecaster', choices=sorted(FORECASTERS), help='forecasting backend')
+
+    backtest_parser = commands.add_parser('backtest', help='backtest AES forecasts on an export')
+    backtest_parser.add_argument('export', help='DistroKid .tsv export')
+    backtest_parser.add_argument(
+        '--setting', action='append', type=parse_setting,
+        help="backend and options to try, e.g. 'prophet changepoint_prior_scale=0.5'; repeatable "
+             '(default: each backend as is)'
+    )
+    backtest_parser.add_argument('--stores', nargs='+', help='stores to backtest (default: all with enough history)')
+    backtest_parser.add_argument('--horizon', type=int, default=12, help='months forecast from each origin')
+    backtest_parser.add_argument('--folds', type=int, default=6, help='origins per store')
+    backtest_parser.add_argument('--step', type=int, default=1, help='months between origins')
+    backtest_parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    backtest_parser.add_argument('--out', help='CSV file for the error of every fold')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+    logging.getLogger('cmdstanpy').disabled = True
+
+    if args.command == 'backtest':
+        return run_backtest(args)
+    failed = report(args.export_dir, args.out, args.workers, args.forecaster)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
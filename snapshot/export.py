@@ -0,0 +1,60 @@
+"""Converted data downloads as CSV, gzip-compressed CSV or Parquet.
+
+Frames are written a chunk of rows at a time, so no single string or table holding
+the whole file is built on the way.
+"""
+import gzip
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Format -> (label, file name, MIME type)
+EXPORT_FORMATS = {
+    'csv': ('CSV', 'Artist_Data.csv', 'text/csv'),
+    'csv.gz': ('CSV (gzip)', 'Artist_Data.csv.gz', 'application/gzip'),
+    'parquet': ('Parquet', 'Artist_Data.parquet', 'application/vnd.apache.parquet'),
+}
+
+EXPORT_CHUNK_ROWS = 100_000
+
+
+def chunks(frame, chunk_rows=EXPORT_CHUNK_ROWS):
+    # An empty frame still yields one (empty) chunk so the header or schema gets written
+    for start in range(0, max(len(frame), 1), chunk_rows):
+        yield start, frame.iloc[start:start + chunk_rows]
+
+
+def write_csv(frame, out, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write ``frame`` as UTF-8 CSV to the binary file ``out``."""
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+    for start, chunk in chunks(frame, chunk_rows):
+        chunk.to_csv(text, index=False, header=start == 0)
+    # Flushes, and leaves ``out`` open for the caller
+    text.detach()
+
+
+def write_parquet(frame, out, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write ``frame`` to the binary file ``out`` as Parquet, one row group per chunk."""
+    writer = None
+    for _, chunk in chunks(frame, chunk_rows):
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(out, table.schema)
+        writer.write_table(table)
+    writer.close()
+
+
+def export_bytes(frame, fmt='csv'):
+    """``frame`` converted to one of EXPORT_FORMATS, as bytes ready to download."""
+    out = io.BytesIO()
+    if fmt == 'csv':
+        write_csv(frame, out)
+    elif fmt == 'csv.gz':
+        with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=6, mtime=0) as compressed:
+            write_csv(frame, compressed)
+    elif fmt == 'parquet':
+        write_parquet(frame, out)
+    else:
+        raise ValueError(f'Unknown export format {fmt!r}; choose one of {", ".join(EXPORT_FORMATS)}')
+    return out.getvalue()
@@ -0,0 +1,223 @@
+"""Monthly AES forecasts, cached by a fingerprint of the input series.
+
+Forecasting backends are plain functions registered in FORECASTERS. Each takes a
+ds/y history and returns a ds/yhat frame for the ``periods`` dates after it; keyword
+options tune the model. The backend used by default comes from the
+SNAPSHOT_FORECASTER environment variable.
+
+Run ``python -m snapshot.forecast`` to compare the backends on the sample data, and
+``python -m snapshot backtest`` to backtest them and their options (see backtest.py).
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from snapshot.cache import FrameCache
+from snapshot.trace import traced
+
+logger = logging.getLogger(__name__)
+
+forecast_cache = FrameCache('forecasts', max_entries=32)
+
+# Stores with fewer months of AES history than this are not forecast
+MIN_HISTORY_MONTHS = 12
+
+
+def future_dates(history, periods, freq):
+    """The ``periods`` dates after a history, generated the way Prophet does it."""
+    last_date = history['ds'].max()
+    dates = pd.date_range(start=last_date, periods=periods + 1, freq=freq)
+    return dates[dates > last_date][:periods]
+
+
+def ets_forecast(history, periods=12, freq='ME', damped_trend=True, seasonal='auto'):
+    """Damped-trend exponential smoothing, with yearly seasonality once there are two years of data.
+
+    ``seasonal`` is 'add', 'mul', None, or 'auto' for additive seasonality given enough history.
+    """
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    y = history['y'].to_numpy(dtype=float)
+    if seasonal == 'auto':
+        seasonal = 'add' if len(y) >= 24 else None
+    model = ExponentialSmoothing(
+        y, trend='add', damped_trend=damped_trend, seasonal=seasonal,
+        seasonal_periods=12 if seasonal else None, initialization_method='estimated'
+    )
+    with warnings.catch_warnings():
+        # Short, noisy AES series regularly trip statsmodels' convergence warnings
+        warnings.simplefilter('ignore')
+        fitted = model.fit()
+    dates = future_dates(history, periods, freq)
+    return pd.DataFrame({'ds': dates, 'yhat': fitted.forecast(len(dates))})
+
+
+def prophet_forecast(history, periods=12, freq='ME', **options):
+    """Meta's Prophet, with its default settings unless ``options`` override them."""
+    from prophet import Prophet
+
+    model = Prophet(**options)
+    model.fit(history[['ds', 'y']])
+    future = model.make_future_dataframe(periods=periods, freq=freq)
+    forecast = model.predict(future)
+    return forecast[forecast['ds'] > history['ds'].max()][['ds', 'yhat']].reset_index(drop=True)
+
+
+FORECASTERS = {
+    'ets': ets_forecast,
+    'prophet': prophet_forecast,
+}
+
+FORECASTER_LABELS = {
+    'ets': 'a Holt-Winters exponential smoothing model',
+    'prophet': "Meta's Prophet model",
+}
+
+# Backends slow enough per fit to be worth the seconds it takes to spawn worker processes.
+# An ETS fit takes about 0.1s, far less than a worker needs just to import statsmodels.
+PARALLEL_FORECASTERS = {'prophet'}
+
+DEFAULT_FORECASTER = os.environ.get('SNAPSHOT_FORECASTER', 'ets')
+
+
+def forecast_key(history, **settings):
+    """Fingerprint of a ds/y series together with the settings used to forecast it."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(history[['ds', 'y']], index=False).to_numpy().tobytes())
+    digest.update(repr(sorted(settings.items())).encode())
+    return digest.hexdigest()
+
+
+@traced
+def fit_forecast(history, periods=12, freq='ME', model=None, **options):
+    """Forecast the ``periods`` months after a monthly ds/y series with the given backend and options."""
+    model = model or DEFAULT_FORECASTER
+    if model not in FORECASTERS:
+        raise ValueError(f'Unknown forecaster {model!r}; choose one of {", ".join(FORECASTERS)}')
+    return FORECASTERS[model](history, periods, freq, **options)
+
+
+def store_histories(aes_platform_m, min_history=MIN_HISTORY_MONTHS):
+    """Split a Month/Store/AES frame into one ds/y series per store with enough history."""
+    histories = {}
+    for store, group in aes_platform_m.groupby('Store', observed=True):
+        history = group.rename(columns={'Month': 'ds', 'AES': 'y'})[['ds', 'y']]
+        # Months with earnings but no streams give an infinite AES
+        history = history[np.isfinite(history['y'])].sort_values('ds').reset_index(drop=True)
+        if len(history) >= min_history:
+            histories[store] = history
+    return histories
+
+
+@traced
+def forecast_platforms(aes_platform_m, periods=12, freq='ME', min_history=MIN_HISTORY_MONTHS, stores=None,
+                       model=None, max_workers=None):
+    """Forecast AES for every store in ``aes_platform_m`` with at least ``min_history`` months.
+
+    ``stores`` optionally restricts this to a subset. Cached forecasts are reused and the
+    remaining stores are fitted in parallel worker processes if the backend is one of
+    PARALLEL_FORECASTERS, or one after another here otherwise. Returns one frame with
+    Store, Month and AES columns.
+    """
+    model = model or DEFAULT_FORECASTER
+    forecasts = {}
+    pending = {}
+    for store, history in store_histories(aes_platform_m, min_history).items():
+        if stores is not None and store not in stores:
+            continue
+        key = forecast_key(history, model=model, periods=periods, freq=freq)
+        forecast = forecast_cache.get(key)
+        if forecast is None:
+            pending[store] = (key, history)
+        else:
+            forecasts[store] = forecast
+
+    workers = min(len(pending), max_workers or os.cpu_count() or 1) if model in PARALLEL_FORECASTERS else 1
+    if workers == 1:
+        # Not worth starting worker processes for a fast backend, a single fit or a single core
+        for store, (key, history) in pending.items():
+            try:
+                forecasts[store] = fit_forecast(history, periods, freq, model)
+            except (ValueError, RuntimeError) as exc:
+                logger.warning('Could not forecast %s: %s', store, exc)
+                continue
+            forecast_cache.put(key, forecasts[store])
+    elif pending:
+        # Spawn rather than fork: the Streamlit server process is multithreaded
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(fit_forecast, history, periods, freq, model): (store, key)
+                       for store, (key, history) in pending.items()}
+            for future in as_completed(futures):
+                store, key = futures[future]
+                try:
+                    forecasts[store] = future.result()
+                except (ValueError, RuntimeError) as exc:
+                    logger.warning('Could not forecast %s: %s', store, exc)
+                    continue
+                forecast_cache.put(key, forecasts[store])
+
+    frames = [forecast.assign(Store=store) for store, forecast in forecasts.items()]
+    if not frames:
+        return pd.DataFrame(columns=['Store', 'Month', 'AES'])
+    tidy = pd.concat(frames, ignore_index=True).rename(columns={'ds': 'Month', 'yhat': 'AES'})
+    return tidy[['Store', 'Month', 'AES']].sort_values(['Store', 'Month'], ignore_index=True)
+
+
+def forecast_errors(actual, forecast):
+    """MAPE (in percent) and RMSE of a ds/yhat forecast against the ds/y months it covers.
+
+    A month whose actual is zero (streams but no earnings) has no percentage error, so
+    MAPE leaves it out and ``zero_actuals`` counts how many were left out.
+    """
+    scored = actual.merge(forecast, on='ds')
+    error = scored['yhat'] - scored['y']
+    nonzero = scored['y'] != 0
+    return {
+        'mape': (error[nonzero].abs() / scored['y'][nonzero].abs()).mean() * 100,
+        'rmse': np.sqrt((error ** 2).mean()),
+        'zero_actuals': int((~nonzero).sum()),
+    }
+
+
+def compare_forecasters(aes_platform_m, holdout=6, models=None, min_history=MIN_HISTORY_MONTHS):
+    """Accuracy and runtime of each backend when forecasting the last ``holdout`` months.
+
+    Every store with ``min_history`` months before the holdout is fitted once per backend.
+    Returns one row per backend with the mean MAPE and RMSE over those stores and the
+    total and mean fitting time in seconds.
+    """
+    rows = []
+    for store, history in store_histories(aes_platform_m, min_history + holdout).items():
+        train, test = history.iloc[:-holdout], history.iloc[-holdout:]
+        for model in models or FORECASTERS:
+            start = time.perf_counter()
+            # Month-start dates line the forecast up with the held-out months
+            forecast = fit_forecast(train, periods=holdout, freq='MS', model=model)
+            seconds = time.perf_counter() - start
+            rows.append({'model': model, 'store': store, **forecast_errors(test, forecast), 'seconds': seconds})
+    results = pd.DataFrame(rows)
+    return results.groupby('model').agg(
+        stores=('store', 'count'),
+        mape=('mape', 'mean'),
+        rmse=('rmse', 'mean'),
+        total_seconds=('seconds', 'sum'),
+        seconds_per_fit=('seconds', 'mean'),
+    )
+
+
+if __name__ == '__main__':
+    from snapshot.analytics import platform_aes_by_month
+    from snapshot.ingest import load_rollup
+
+    # cmdstanpy logs every Prophet fit at INFO level
+    logging.getLogger('cmdstanpy').disabled = True
+    with open('sample_data/DistroKid_1734544230367.tsv', 'rb') as f:
+        sample = f.read()
+    print(compare_forecasters(platform_aes_by_month(load_rollup(sample))).to_string())
@@ -0,0 +1,344 @@
+"""Reading and cleaning DistroKid exports."""
+import functools
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.extensions import take
+from pandas.api.types import union_categoricals
+from pyarrow import csv as pa_csv
+
+from snapshot.cache import CACHE_BUDGET_BYTES, FrameCache, content_hash
+from snapshot.trace import traced
+
+# Bump whenever cleaning_process changes its output so stale cache files are ignored
+CLEANING_VERSION = 3
+
+# Process-wide: every session that loads the same export shares these frames
+ingest_cache = FrameCache('ingest', max_bytes=CACHE_BUDGET_BYTES)
+rollup_cache = FrameCache('rollup', max_bytes=CACHE_BUDGET_BYTES)
+
+# Text columns in an export repeat a few hundred distinct values across millions of rows
+CATEGORICAL_COLUMNS = ['Store', 'Artist', 'Title', 'Country', 'Sale Month']
+
+# Grain of the aggregate the dashboard pages read. Month is the sale month; Year is the
+# reporting year, which the yearly charts group by.
+ROLLUP_KEYS = ['Month', 'Year', 'Store', 'Title', 'Country']
+ROLLUP_VALUES = ['Quantity', 'Earnings']
+
+# Columns of a DistroKid export and the type each is read as. Reporting Date stays text
+# because DistroKid writes '#' for dates it does not know yet.
+EXPORT_SCHEMA = {
+    'Reporting Date': pa.string(),
+    'Sale Month': pa.string(),
+    'Store': pa.string(),
+    'Artist': pa.string(),
+    'Title': pa.string(),
+    'ISRC': pa.string(),
+    'UPC': pa.string(),
+    'Quantity': pa.int64(),
+    'Team Percentage': pa.float64(),
+    'Song/Album': pa.string(),
+    'Country of Sale': pa.string(),
+    'Songwriter Royalties Withheld': pa.float64(),
+    'Earnings (USD)': pa.float64(),
+}
+# Columns cleaning_process drops anyway, so an export may leave them out
+OPTIONAL_COLUMNS = {'ISRC', 'UPC', 'Team Percentage', 'Song/Album', 'Songwriter Royalties Withheld'}
+
+# The strings pandas.read_csv treats as missing, so both readers agree on what is NA
+NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A',
+    'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
+
+# Arrow parses blocks in parallel on a thread pool, which only pays off with more than one core
+PARSE_THREADS = (os.cpu_count() or 1) > 1
+
+# Bytes of raw export parsed per block when streaming; bounds peak memory regardless of file size
+STREAM_BLOCK_BYTES = 32 * 1024 ** 2
+
+# Exports larger than this are only streamed into the rollup; their row-level frame is never built
+STREAMING_THRESHOLD_BYTES = int(os.environ.get('SNAPSHOT_STREAMING_THRESHOLD_MB', 256)) * 1024 ** 2
+
+
+@functools.lru_cache(maxsize=None)
+def country_lookup():
+    """Alpha-2 code -> country name for every country pycountry knows, built once per process."""
+    import pycountry
+
+    lookup = {country.alpha_2: country.name for country in pycountry.countries}
+    # 'OU' is DistroKid's code for sales it could not attribute to a country
+    lookup.pop('OU', None)
+    return lookup
+
+
+def country_names(codes):
+    """Map a column of alpha-2 codes to country names; missing or unrecognised codes become 'Unknown'."""
+    codes = codes.astype('category')
+    lookup = country_lookup()
+    names = [lookup.get(str(code).upper(), 'Unknown') for code in codes.cat.categories]
+    # Missing values have code -1, which picks up this trailing entry
+    names.append('Unknown')
+    return pd.Series(np.array(names, dtype=object)[codes.cat.codes], index=codes.index)
+
+
+@traced
+def cleaning_process(artist_data):
+    # Drop unnecessary columns
+    columns_to_drop = ['ISRC', 'UPC', 'Team Percentage', 'Song/Album', 'Songwriter Royalties Withheld']
+    artist_data = artist_data.drop(columns=[col for col in columns_to_drop if col in artist_data.columns], errors='ignore')
+
+    # Renaming 'Earnings (USD)' to 'Earnings'
+    if 'Earnings (USD)' in artist_data.columns:
+        artist_data['Earnings'] = artist_data['Earnings (USD)']
+        artist_data = artist_data.drop(columns=['Earnings (USD)'])
+
+    # Convert 2-letter country codes to full country names
+    if 'Country of Sale' in artist_data.columns:
+        artist_data['Country'] = country_names(artist_data['Country of Sale'])
+        artist_data = artist_data.drop(columns=['Country of Sale'])
+
+    if 'Reporting Date' in artist_data.columns:
+        # Exports repeat a few hundred distinct dates, so each one is parsed once
+        artist_data['Reporting Date'] = map_unique(artist_data['Reporting Date'], parse_reporting_dates)
+
+        # For rows with missing Reporting Date, infer from Sale Month
+        if 'Sale Month' in artist_data.columns:
+            missing_reporting_date = artist_data['Reporting Date'].isna()
+            artist_data.loc[missing_reporting_date, 'Reporting Date'] = map_unique(
+                artist_data.loc[missing_reporting_date, 'Sale Month'], parse_sale_month_starts
+            )
+
+        # Optional: Drop rows with invalid dates after all attempts to clean
+        artist_data = artist_data.dropna(subset=['Reporting Date'])
+
+    return add_time_columns(apply_schema(artist_data))
+
+
+def add_time_columns(artist_data):
+    """Derive the reporting Year and the sale Month (a monthly Period) the pages group by.
+
+    Both are recomputed from Reporting Date and Sale Month, so calling this on an
+    already cleaned frame gives the same result.
+    """
+    if 'Reporting Date' in artist_data.columns:
+        artist_data['Year'] = artist_data['Reporting Date'].dt.year.astype('int16')
+    if 'Sale Month' in artist_data.columns:
+        artist_data['Month'] = map_unique(artist_data['Sale Month'], parse_sale_months)
+    return artist_data
+
+
+def map_unique(values, convert):
+    """``convert`` applied to each distinct value of ``values`` once and mapped back onto every row.
+
+    ``convert`` takes and returns a Series of the distinct values. Missing values are
+    never passed to it and come out as missing.
+    """
+    codes, uniques = pd.factorize(values)
+    converted = convert(pd.Series(uniques)).array
+    return pd.Series(take(converted, codes, allow_fill=True), index=values.index)
+
+
+def parse_reporting_dates(dates):
+    """Reporting Date text as timestamps; DistroKid's '#' placeholder and other invalid entries become NaT."""
+    dates = dates.astype(str).replace(r'^[#]+$', pd.NA, regex=True)
+    return pd.to_datetime(dates, errors='coerce', format='%Y-%m-%d')
+
+
+def parse_sale_month_starts(sale_months):
+    """The first day of each 'YYYY-MM' sale month, standing in for a missing Reporting Date."""
+    return pd.to_datetime(sale_months.astype(str) + '-01', errors='coerce')
+
+
+def parse_sale_months(sale_months):
+    return pd.to_datetime(sale_months.astype(str), format='%Y-%m', errors='coerce').dt.to_period('M')
+
+
+def apply_schema(artist_data):
+    """Store the cleaned frame compactly: categorical text columns and the narrowest integer Quantity."""
+    artist_data = artist_data.astype({col: 'category' for col in CATEGORICAL_COLUMNS if col in artist_data.columns})
+    if 'Quantity' in artist_data.columns:
+        artist_data['Quantity'] = pd.to_numeric(artist_data['Quantity'], downcast='integer')
+    return artist_data
+
+
+def concat_cleaned(blocks):
+    """Cleaned blocks of one export as a single frame, the same as cleaning it all at once.
+
+    Categorical columns are merged with union_categoricals instead of being rebuilt from text.
+    """
+    columns = {}
+    for col in blocks[0].columns:
+        parts = [block[col] for block in blocks]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            columns[col] = union_categoricals(parts, sort_categories=True)
+        else:
+            columns[col] = pd.concat(parts).array
+    index = blocks[0].index.append([block.index for block in blocks[1:]])
+    return apply_schema(pd.DataFrame(columns, index=index))
+
+
+def memory_report(artist_data):
+    """Bytes per column of the compact frame next to the plain object/int64 layout it replaces."""
+    plain = artist_data.astype({
+        col: (object if isinstance(dtype, pd.CategoricalDtype) else 'int64')
+        for col, dtype in artist_data.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_integer_dtype(dtype)
+    })
+    report = pd.DataFrame({
+        'Before (bytes)': plain.memory_usage(index=False, deep=True),
+        'After (bytes)': artist_data.memory_usage(index=False, deep=True),
+    })
+    report.loc['Total'] = report.sum()
+    report['Reduction'] = report['Before (bytes)'] / report['After (bytes)']
+    return report
+
+
+class ExportSchemaError(ValueError):
+    """An export whose columns or values don't match EXPORT_SCHEMA."""
+
+
+def export_file(source):
+    """Open raw export bytes or a path for Arrow; bytes are wrapped and files memory-mapped, not copied."""
+    if isinstance(source, (str, os.PathLike)):
+        return pa.memory_map(os.fspath(source))
+    return pa.BufferReader(pa.py_buffer(source))
+
+
+def export_columns(file):
+    """Column names on the first line of an export, checked against EXPORT_SCHEMA."""
+    head = file.read_at(min(file.size(), 64 * 1024), 0)
+    # Exports have been seen with \r, \n and \r\n line endings
+    columns = re.split(rb'\r\n?|\n', head, maxsplit=1)[0].decode('utf-8-sig').split('\t')
+    missing = [col for col in EXPORT_SCHEMA if col not in columns and col not in OPTIONAL_COLUMNS]
+    if missing:
+        raise ExportSchemaError(
+            f'Not a DistroKid export, or its layout has changed: missing column(s) {", ".join(missing)}'
+        )
+    return columns
+
+
+def csv_options(columns, block_size=None):
+    """Arrow CSV options that read ``columns`` with the EXPORT_SCHEMA types; other columns stay text."""
+    read_options = pa_csv.ReadOptions(use_threads=PARSE_THREADS)
+    if block_size:
+        read_options.block_size = block_size
+    parse_options = pa_csv.ParseOptions(delimiter='\t')
+    convert_options = pa_csv.ConvertOptions(
+        column_types={col: EXPORT_SCHEMA.get(col, pa.string()) for col in columns},
+        null_values=NULL_VALUES, strings_can_be_null=True,
+    )
+    return {'read_options': read_options, 'parse_options': parse_options, 'convert_options': convert_options}
+
+
+def schema_error(exc):
+    return ExportSchemaError(f'Export does not match the DistroKid layout: {exc}')
+
+
+@traced
+def read_export(data):
+    """Parse raw export bytes, or an export file, with Arrow's multithreaded CSV reader."""
+    with export_file(data) as file:
+        try:
+            table = pa_csv.read_csv(file, **csv_options(export_columns(file)))
+        except pa.ArrowInvalid as exc:
+            raise schema_error(exc) from exc
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def export_key(data):
+    """Cache key for an export, given as raw bytes or a path: its content hash plus the cleaning version."""
+    return f'v{CLEANING_VERSION}-{content_hash(data)}'
+
+
+@traced
+def load_export(data, copy=True):
+    """Parse and clean raw export bytes or an export file, reusing earlier results for identical files.
+
+    With ``copy=False`` the cached frame itself is returned and must not be modified.
+    """
+    return ingest_cache.get_or_compute(export_key(data), lambda: cleaning_process(read_export(data)), copy)
+
+
+def export_size(data):
+    if isinstance(data, (str, os.PathLike)):
+        return os.path.getsize(data)
+    return len(data)
+
+
+def is_streamed(data):
+    return export_size(data) > STREAMING_THRESHOLD_BYTES
+
+
+@traced
+def load_rollup(data, copy=True):
+    """Rollup of an export, cached like load_export; large exports are streamed.
+
+    Pass large exports as a path: they are then hashed and streamed from the file
+    without ever being read into memory whole.
+    """
+    def compute():
+        if is_streamed(data):
+            return stream_rollup(data)
+        return rollup(load_export(data, copy=False))
+
+    return rollup_cache.get_or_compute(export_key(data), compute, copy)
+
+
+def cached_rows(key):
+    """Cleaned rows loaded earlier under ``key``, shared rather than copied.
+
+    None if they were never built (streamed exports have no cleaned rows) or have
+    since been evicted from both memory and disk.
+    """
+    return ingest_cache.get(key, copy=False)
+
+
+def cached_rollup(key):
+    """Rollup loaded earlier under ``key``, shared rather than copied; None once evicted from memory and disk.
+
+    Pages that only chart the rollup ask for it alone, so the much larger cleaned rows
+    are not read back from disk on their account.
+    """
+    return rollup_cache.get(key, copy=False)
+
+
+@traced
+def rollup(artist_data):
+    """Sum Quantity and Earnings of cleaned rows over ROLLUP_KEYS."""
+    # dropna=False keeps rows with a missing Title/Store so overall totals still add up
+    return artist_data.groupby(ROLLUP_KEYS, observed=True, dropna=False, sort=False)[ROLLUP_VALUES].sum().reset_index()
+
+
+def combine_rollups(rollups):
+    """Fold several partial rollups into one."""
+    combined = pd.concat(rollups, ignore_index=True)
+    # Partial rollups carry different categories, so the keys arrive here as plain objects
+    combined = combined.groupby(ROLLUP_KEYS, observed=True, dropna=False, sort=False)[ROLLUP_VALUES].sum().reset_index()
+    return combined.astype({col: 'category' for col in ROLLUP_KEYS if col in CATEGORICAL_COLUMNS})
+
+
+@traced
+def stream_rollup(source, block_size=STREAM_BLOCK_BYTES):
+    """Rollup of an export read and cleaned block by block.
+
+    ``source`` is raw export bytes or a path. Only one block of raw rows is in memory
+    at a time, and a path is memory-mapped rather than read, so an export on disk need
+    not fit in RAM.
+    """
+    total = None
+    with export_file(source) as file:
+        try:
+            reader = pa_csv.open_csv(file, **csv_options(export_columns(file), block_size))
+            for batch in reader:
+                partial = rollup(cleaning_process(batch.to_pandas(split_blocks=True)))
+                total = partial if total is None else combine_rollups([total, partial])
+        except pa.ArrowInvalid as exc:
+            raise schema_error(exc) from exc
+        if total is None:
+            # Nothing but a header: roll up its empty table, so the columns are typed as load_rollup's
+            return rollup(cleaning_process(reader.schema.empty_table().to_pandas()))
+    return combine_rollups([total])
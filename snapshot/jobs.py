@@ -0,0 +1,186 @@
+"""Background ingest, so a large upload doesn't freeze the dashboard.
+
+An upload is parsed and cleaned block by block on a process-wide thread pool. While it
+runs, any thread can read how many bytes have been parsed and rows cleaned, and a
+rollup of the blocks done so far. Once it finishes, the cleaned rows and rollup are in
+the ingest and rollup caches, exactly as load_export and load_rollup would have left
+them. Sessions uploading the same export share one job, and different exports are
+ingested side by side, up to INGEST_WORKERS at a time.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+
+from snapshot.ingest import (
+    ExportSchemaError, cleaning_process, combine_rollups, concat_cleaned, csv_options, export_columns, export_file, export_key,
+    ingest_cache, is_streamed, load_rollup, rollup, rollup_cache, schema_error
+)
+from snapshot.trace import traced
+
+logger = logging.getLogger(__name__)
+
+# Uploads ingested at the same time; further ones wait for a free worker
+INGEST_WORKERS = int(os.environ.get('SNAPSHOT_INGEST_WORKERS', 4))
+
+# Bytes of raw export per block: how often progress and the partial rollup move forward
+INGEST_BLOCK_BYTES = 16 * 1024 ** 2
+
+# Partial rollups kept before the worker folds them into one, which bounds their memory
+MAX_PARTIALS = 8
+
+_pool = ThreadPoolExecutor(INGEST_WORKERS, thread_name_prefix='snapshot-ingest')
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class IngestJob:
+    """One export being parsed and cleaned on the ingest pool.
+
+    ``error`` is set if the export turned out to be unreadable part way through, or the
+    ingest failed otherwise; the job is then ``done``, its results never reach the caches
+    and the rows it had cleaned are dropped. Starting the same export again retries it,
+    unless the export itself was at fault (an ExportSchemaError).
+    """
+
+    def __init__(self, key, total_bytes):
+        self.key = key
+        self.total_bytes = total_bytes
+        self.bytes_parsed = 0
+        self.rows_cleaned = 0
+        self.error = None
+        self._blocks = []
+        self._rolled_up = 0
+        self._partials = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def progress(self):
+        """Share of the export parsed so far, between 0 and 1."""
+        if self.done or not self.total_bytes:
+            return 1.0
+        return min(self.bytes_parsed / self.total_bytes, 1.0)
+
+    def wait(self, timeout=None):
+        """Block until the job is done; returns False if ``timeout`` seconds passed first."""
+        return self._done.wait(timeout)
+
+    def partial_rollup(self):
+        """Rows cleaned so far and the rollup of them, or (0, None) before the first block is done.
+
+        Blocks are only rolled up here, when someone asks, so an upload nobody looks at
+        in the meantime costs no more than a synchronous load. The rollup is shared with
+        the job and other sessions and must not be modified.
+        """
+        with self._lock:
+            self._partials.extend(rollup(block) for block in self._blocks[self._rolled_up:])
+            self._rolled_up = len(self._blocks)
+            if len(self._partials) > 1:
+                self._partials = [combine_rollups(self._partials)]
+            return self.rows_cleaned, (self._partials[0] if self._partials else None)
+
+    def _discard(self):
+        """Let go of the cleaned blocks and partial rollups of a failed job."""
+        with self._lock:
+            self._blocks = []
+            self._rolled_up = 0
+            self._partials = []
+
+    @property
+    def retryable(self):
+        return self.done and self.error is not None and not isinstance(self.error, ExportSchemaError)
+
+    def _add_block(self, cleaned, keep):
+        """Count a cleaned block; it is kept as is, or else rolled up straight away to free its rows."""
+        partial = None if keep else rollup(cleaned)
+        with self._lock:
+            if keep:
+                self._blocks.append(cleaned)
+            else:
+                self._partials.append(partial)
+                if len(self._partials) > MAX_PARTIALS:
+                    self._partials = [combine_rollups(self._partials)]
+            self.rows_cleaned += len(cleaned)
+            # Arrow hands out one record batch per block of raw bytes
+            self.bytes_parsed = min(self.bytes_parsed + INGEST_BLOCK_BYTES, self.total_bytes)
+
+
+@traced
+def run_ingest(job, data):
+    """Parse and clean ``data`` block by block for ``job``, then store the results in the caches."""
+    # Very large exports are only streamed into the rollup, so their cleaned rows are not kept
+    keep_rows = not is_streamed(data)
+    rows_read = 0
+    try:
+        with export_file(data) as file:
+            reader = pa_csv.open_csv(file, **csv_options(export_columns(file), INGEST_BLOCK_BYTES))
+            for batch in reader:
+                cleaned = cleaning_process(batch.to_pandas(split_blocks=True))
+                # Number rows as reading the whole export at once would
+                cleaned.index = cleaned.index + rows_read
+                rows_read += batch.num_rows
+                job._add_block(cleaned, keep_rows)
+
+        if rows_read == 0:
+            # Nothing but a header: the synchronous loaders build the empty frames
+            load_rollup(data, copy=False)
+        elif keep_rows:
+            artist_data = concat_cleaned(job._blocks)
+            ingest_cache.put(job.key, artist_data)
+            rollup_cache.put(job.key, rollup(artist_data))
+        else:
+            _, total = job.partial_rollup()
+            rollup_cache.put(job.key, combine_rollups([total]))
+    except pa.ArrowInvalid as exc:
+        job._discard()
+        job.error = schema_error(exc)
+    except Exception as exc:  # noqa: BLE001 - surfaced to the session through the job
+        logger.exception('Ingest of %s failed', job.key)
+        job._discard()
+        job.error = exc
+    finally:
+        # Results are in the caches before the job disappears, so readers always find one or the other
+        if job.error is None:
+            with _jobs_lock:
+                _jobs.pop(job.key, None)
+        job._done.set()
+
+
+def start_ingest(data):
+    """Start ingesting raw export bytes in the background, or join the job already doing so.
+
+    Returns the IngestJob, or None if the export is already in the caches. Raises
+    ExportSchemaError right away if the header doesn't match; problems found further
+    into the file end up in the job's ``error``. A job that failed for any other reason,
+    such as running out of memory, is replaced by a fresh one.
+    """
+    key = export_key(data)
+    job = ingest_job(key)
+    if job is not None and not job.retryable:
+        return job
+    if rollup_cache.get(key, copy=False) is not None and (
+        is_streamed(data) or ingest_cache.get(key, copy=False) is not None
+    ):
+        return None
+    with export_file(data) as file:
+        export_columns(file)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is None or job.retryable:
+            job = _jobs[key] = IngestJob(key, len(data))
+            _pool.submit(run_ingest, job, data)
+    return job
+
+
+def ingest_job(key):
+    """The running or most recently failed IngestJob for a dataset key, or None once its results are cached."""
+    with _jobs_lock:
+        return _jobs.get(key)
@@ -0,0 +1,154 @@
+"""Local library that accumulates overlapping DistroKid exports.
+
+Each DistroKid download repeats the full history, so exports are merged into a Parquet
+dataset partitioned by Sale Month (``sale_month=YYYY-MM/part.parquet``, with rows that
+have no valid month under ``sale_month=_undated``). Rows are identified by a hash of
+their natural key, and only partitions that gain new rows are rewritten.
+
+Every user has a library of their own: a subdirectory of LIBRARY_DIR named by an
+unguessable id (see new_library_id), which the dashboard keeps in the page URL.
+"""
+import hashlib
+import io
+import os
+import re
+import secrets
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from snapshot.ingest import (
+    CLEANING_VERSION, cleaning_process, export_columns, export_file, ingest_cache, rollup, rollup_cache
+)
+from snapshot.trace import traced
+
+LIBRARY_DIR = Path(os.environ.get('SNAPSHOT_LIBRARY_DIR', '.snapshot_library'))
+
+# Raw export columns that identify a row across downloads
+NATURAL_KEY = ['Reporting Date', 'Sale Month', 'Store', 'ISRC', 'Country of Sale', 'Quantity', 'Earnings (USD)']
+NUMERIC_COLUMNS = ['Quantity', 'Earnings (USD)', 'Team Percentage', 'Songwriter Royalties Withheld']
+
+# Sale Month values that get a partition of their own; anything else, including a missing
+# month, goes to UNDATED_PARTITION, which no YYYY-MM month can be mistaken for
+SALE_MONTH_PATTERN = re.compile(r'\d{4}-\d{2}')
+UNDATED_PARTITION = '_undated'
+
+_write_lock = threading.Lock()
+
+
+def new_library_id():
+    return secrets.token_hex(16)
+
+
+def library_dir(library_id):
+    """Directory of the library with the given id; raises ValueError for anything new_library_id can't return."""
+    if not isinstance(library_id, str) or not re.fullmatch(r'[0-9a-f]{32}', library_id):
+        raise ValueError(f'Not a library id: {library_id!r}')
+    return LIBRARY_DIR / library_id
+
+
+def read_export_text(data):
+    """Read an export keeping every value as the exported text, so keys compare verbatim."""
+    return pd.read_csv(io.BytesIO(data), sep='\t', dtype=str)
+
+
+def row_keys(raw):
+    """64-bit identity of each row: its natural key plus how often that key already occurred.
+
+    Counting occurrences keeps genuinely repeated lines within one export apart while
+    still matching them against the same lines in a later export.
+    """
+    key = raw.reindex(columns=NATURAL_KEY).fillna('')
+    occurrence = key.groupby(NATURAL_KEY, sort=False).cumcount()
+    return pd.util.hash_pandas_object(key.assign(occurrence=occurrence), index=False).rename('_key')
+
+
+def partition_name(sale_month):
+    """The partition a raw Sale Month goes to: itself if it is a YYYY-MM month, else UNDATED_PARTITION."""
+    if isinstance(sale_month, str) and SALE_MONTH_PATTERN.fullmatch(sale_month):
+        return sale_month
+    return UNDATED_PARTITION
+
+
+def partition_path(sale_month, directory=None):
+    root = Path(directory or LIBRARY_DIR)
+    path = root / f'sale_month={partition_name(sale_month)}' / 'part.parquet'
+    # partition_name only lets months and the fixed bucket through, so this cannot fail
+    if not path.resolve().is_relative_to(root.resolve()):
+        raise ValueError(f'Partition path {path} is outside the library {root}')
+    return path
+
+
+@traced
+def add_export(data, directory=None):
+    """Merge raw export bytes into the library.
+
+    Returns a dict with the number of ``new_rows`` and the ``partitions`` that were written.
+    Raises ExportSchemaError, before anything is written, if ``data`` is not a DistroKid export.
+    """
+    with export_file(data) as file:
+        export_columns(file)
+    raw = read_export_text(data)
+    raw['_key'] = row_keys(raw)
+    new_rows = 0
+    written = []
+    with _write_lock:
+        partition = raw['Sale Month'].map(partition_name)
+        for sale_month, rows in raw.groupby(partition, sort=False):
+            path = partition_path(sale_month, directory)
+            if path.exists():
+                known = pd.read_parquet(path, columns=['_key'])['_key']
+                rows = rows[~rows['_key'].isin(known)]
+                if rows.empty:
+                    continue
+                merged = pd.concat([pd.read_parquet(path), rows], ignore_index=True)
+            else:
+                merged = rows
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            merged.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            new_rows += len(rows)
+            written.append(sale_month)
+    return {'new_rows': new_rows, 'partitions': sorted(written)}
+
+
+def partitions(directory=None):
+    return sorted(Path(directory or LIBRARY_DIR).glob('sale_month=*/part.parquet'))
+
+
+def has_library(directory=None):
+    return bool(partitions(directory))
+
+
+def library_key(directory=None):
+    """Cache key that changes whenever any partition is rewritten."""
+    digest = hashlib.blake2b(digest_size=16)
+    # Libraries whose partitions happen to look alike still get keys of their own
+    digest.update(f'{Path(directory or LIBRARY_DIR).resolve()};'.encode())
+    for path in partitions(directory):
+        stat = path.stat()
+        digest.update(f'{path.parent.name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return f'v{CLEANING_VERSION}-library-{digest.hexdigest()}'
+
+
+def read_library(directory=None):
+    """All library rows in the shape read_export returns."""
+    raw = pd.concat([pd.read_parquet(path) for path in partitions(directory)], ignore_index=True)
+    raw = raw.drop(columns=['_key'])
+    for col in NUMERIC_COLUMNS:
+        if col in raw.columns:
+            raw[col] = pd.to_numeric(raw[col])
+    return raw
+
+
+@traced
+def load_library(directory=None, copy=True):
+    """Cleaned frame and rollup of the whole library, cached until it changes.
+
+    With ``copy=False`` the cached frames themselves are returned and must not be modified.
+    """
+    key = library_key(directory)
+    cleaned = ingest_cache.get_or_compute(key, lambda: cleaning_process(read_library(directory)), copy)
+    return cleaned, rollup_cache.get_or_compute(key, lambda: rollup(cleaned), copy)
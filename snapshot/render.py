@@ -0,0 +1,42 @@
+"""HTML for the dashboard's ranked lists.
+
+Each list is built as a single HTML string with vectorised string operations, so it can
+be sent to the browser in one element however many entries it has.
+"""
+from html import escape
+
+import pandas as pd
+
+_ROW_START = (
+    '<div style="display: flex; align-items: center; margin-bottom: 10px;">'
+    '<div style="font-size: 20px; font-weight: bold; color: white; text-align: left; width: fit-content;">'
+)
+_ROW_MIDDLE = (
+    '</div>'
+    '<div style="flex-grow: 1; height: 2px; background-image: linear-gradient(to right, white, #37faa9); margin: 0 10px;"></div>'
+    '<div style="font-size: 16px; font-weight: bold; color: #37faa9; text-align: right; width: fit-content;">'
+)
+_ROW_END = '</div></div>'
+_GROUP_START = "<div style='font-size: 24px; font-weight: bold; color: #37faa9; margin-top: 20px;'>"
+_GROUP_END = '</div>'
+
+
+def _text(values):
+    return pd.Series(values).reset_index(drop=True).astype(str).map(escape)
+
+
+def _rows(labels, values):
+    return _ROW_START + _text(labels) + _ROW_MIDDLE + _text(values) + _ROW_END
+
+
+def list_html(labels, values):
+    """Rows of ``label ─── value``; values should already be formatted for display."""
+    return _rows(labels, values).str.cat()
+
+
+def grouped_list_html(groups, labels, values):
+    """Like list_html, with a heading wherever ``groups`` changes (e.g. a release year)."""
+    groups = pd.Series(groups).reset_index(drop=True)
+    starts = groups.ne(groups.shift())
+    headings = (_GROUP_START + _text(groups) + _GROUP_END).where(starts, '')
+    return (headings + _rows(labels, values)).str.cat()
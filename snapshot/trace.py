@@ -0,0 +1,102 @@
+"""Opt-in timing of the dashboard's hot paths.
+
+Functions decorated with ``traced`` and blocks wrapped in ``span`` are measured when
+tracing is on: set SNAPSHOT_TRACE=1, or open the dashboard with ``?trace=1``. Each
+finished span is logged on the ``snapshot.trace`` logger as one JSON object with its
+duration, nesting depth, result row count and change in resident memory. Spans are
+also collected into the list ``start_recording()`` returns, which the dashboard starts
+on every rerun and shows in the sidebar.
+
+With tracing off and nothing recording, a span costs one context variable lookup.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('SNAPSHOT_TRACE', '') not in ('', '0')
+
+_records = contextvars.ContextVar('snapshot_trace_records', default=None)
+_depth = contextvars.ContextVar('snapshot_trace_depth', default=0)
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def resident_bytes():
+    """Resident memory of this process, or None where /proc is not available."""
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return None
+
+
+@contextlib.contextmanager
+def span(name, **fields):
+    """Time the enclosed block.
+
+    Yields a dict that is logged along with the timing, so the block can add details
+    such as ``fields['rows'] = len(frame)``.
+    """
+    records = _records.get()
+    if not ENABLED and records is None:
+        yield fields
+        return
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    rss_before = resident_bytes()
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        seconds = time.perf_counter() - start
+        rss_after = resident_bytes()
+        _depth.reset(token)
+        record = {
+            'span': name,
+            'depth': depth,
+            'seconds': round(seconds, 6),
+            'memory_delta_mib': (
+                None if rss_before is None or rss_after is None else round((rss_after - rss_before) / 1024 ** 2, 2)
+            ),
+            **fields,
+        }
+        logger.info(json.dumps(record, default=str))
+        if records is not None:
+            records.append(record)
+
+
+def traced(func):
+    """Run every call of ``func`` in a span named after it, recording the row count of its result."""
+    name = f'{func.__module__.rpartition(".")[2]}.{func.__name__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name) as fields:
+            result = func(*args, **kwargs)
+            if hasattr(result, 'shape'):
+                fields['rows'] = result.shape[0]
+            return result
+
+    return wrapper
+
+
+def start_recording():
+    """Collect the spans of the current thread from now on into the returned list.
+
+    Each call replaces the previous list, which suits the dashboard script: it starts a
+    new recording at the top of every rerun and shows it at the bottom.
+    """
+    records = []
+    _records.set(records)
+    return records